@@ -0,0 +1,48 @@
+import time
+
+# Adds the scripts to the path, import before the app modules.
+from synthetic import SpotifyMock, generate_frames, join_frames
+from spotifyapp import SpotifyApp
+from spotifydata import SpotifyData
+
+
+def legacy_merge(app, df_fp, df_p, df_t, df_af):
+    """
+    Merge on the string IDs and convert the merged dataframe.
+    """
+    return app.convert_dtypes(join_frames(df_fp, df_p, df_t, df_af))
+
+
+def main(repeat: int = 3) -> None:
+    """
+    Compare the legacy merge with 'SpotifyApp.merge_data'.
+    """
+    app = SpotifyApp.__new__(SpotifyApp)  # No API client needed.
+    app.data = SpotifyData()
+    frames = generate_frames(SpotifyMock(), "SE", "2023-05-24")
+
+    # Both merges return the same rows and datatypes.
+    legacy = legacy_merge(app, *(f.copy() for f in frames))
+    merged = app.merge_data(*(f.copy() for f in frames))
+    columns = list(legacy.columns)
+    assert legacy.dtypes.equals(merged.dtypes)
+    assert (
+        legacy.sort_values(columns)
+        .reset_index(drop=True)
+        .equals(merged.sort_values(columns).reset_index(drop=True))
+    )
+    print(f"Merged rows: {len(merged):,}")
+
+    for name, merge in [("legacy", legacy_merge), ("merge_data", SpotifyApp.merge_data)]:
+        timings = list()
+        for _ in range(repeat):
+            copies = [f.copy() for f in frames]
+            start = time.perf_counter()
+            merge(app, *copies)
+            timings.append(time.perf_counter() - start)
+        print(f"{name:<12} best of {repeat}: {min(timings):.3f}s")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import argparse
+import io
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Adds the scripts to the path, import before the app modules.
+from synthetic import SpotifyMock, generate_frames
+from bench_stages import measure, shift_days
+from main import write_parquet
+from spotifyapp import SpotifyApp
+from spotifydata import SpotifyData
+
+# The settings compared, by name, the options of 'write_parquet'.
+SETTINGS = {
+    "snappy (pyarrow default)": {
+        "compression": "snappy",
+        "dictionary": True,
+    },
+    "zstd:1": {
+        "compression": "zstd",
+        "compression_level": 1,
+        "dictionary": True,
+    },
+    "zstd:3": {
+        "compression": "zstd",
+        "compression_level": 3,
+        "dictionary": True,
+    },
+    "zstd:9": {
+        "compression": "zstd",
+        "compression_level": 9,
+        "dictionary": True,
+    },
+    "zstd:3 dictionary strings": {
+        "compression": "zstd",
+        "compression_level": 3,
+        "dictionary": "strings",
+    },
+    "zstd:3 dictionary none (default)": {},
+    "zstd:3 sorted": {
+        "compression": "zstd",
+        "compression_level": 3,
+        "dictionary": True,
+        "sort_by": ("playlist_id", "track_id"),
+    },
+    "zstd:3 dictionary none sorted": {
+        "sort_by": ("playlist_id", "track_id"),
+    },
+    "zstd:3 dictionary none sorted 10k": {
+        "row_group_size": 10_000,
+        "sort_by": ("playlist_id", "track_id"),
+    },
+}
+
+
+def read_playlist(data: bytes, playlist_id: str) -> tuple:
+    """
+    Read the rows of a playlist, skipping the row groups whose
+    statistics rule out the playlist. Return the rows and the
+    number of row groups read.
+    """
+    file = pq.ParquetFile(pa.BufferReader(data))
+    column = file.schema_arrow.get_field_index("playlist_id")
+    row_groups = list()
+    for i in range(file.num_row_groups):
+        stats = file.metadata.row_group(i).column(column).statistics
+        if stats is None or stats.min <= playlist_id <= stats.max:
+            row_groups.append(i)
+    table = file.read_row_groups(row_groups)
+    return table.filter(pc.equal(table["playlist_id"], playlist_id)), len(row_groups)
+
+
+def main(args: argparse.Namespace) -> None:
+    """
+    Compare the size, write and read time of the Parquet settings.
+    """
+    app = SpotifyApp.__new__(SpotifyApp)  # No API client needed.
+    app.data = SpotifyData()
+    mock = SpotifyMock()
+    countries = ["SE", "DE", "US", "BR", "JP", "ZA"][: args.countries]
+    df = pd.concat(
+        [app.merge_data(*generate_frames(mock, c, args.date)) for c in countries],
+        ignore_index=True,
+    )
+    df = shift_days(df, args.days)
+    playlist_id = df["playlist_id"].iloc[len(df) // 2]
+    print(f"Rows: {len(df):,} of {len(countries)} countries over {args.days} days")
+
+    header = f"{'setting':<44} {'MiB':>7} {'write (s)':>10} {'read (s)':>9} {'lookup (s)':>11} {'groups':>7}"
+    print(header)
+    baseline = None
+    for name, options in SETTINGS.items():
+        stream = io.BytesIO()
+        write_parquet(df, stream, **options)
+        data = stream.getvalue()
+
+        # Every setting stores the same rows.
+        table = pq.read_table(pa.BufferReader(data))
+        assert table.num_rows == len(df)
+        rows, groups = read_playlist(data, playlist_id)
+        assert rows.num_rows == (df["playlist_id"] == playlist_id).sum()
+
+        write, _ = measure(lambda: write_parquet(df, io.BytesIO(), **options), repeat=args.repeat)
+        read, _ = measure(lambda: pq.read_table(pa.BufferReader(data)), repeat=args.repeat)
+        lookup, _ = measure(lambda: read_playlist(data, playlist_id), repeat=args.repeat)
+        baseline = baseline or len(data)
+        print(
+            f"{name:<44} {len(data) / 2**20:>7.2f} {write:>10.3f} {read:>9.3f}"
+            f" {lookup:>11.3f} {groups:>7}  ({len(data) / baseline - 1:+.0%})"
+        )
+    return
+
+
+if __name__ == "__main__":
+    # Write the merged data of a few countries with every setting,
+    # a country holds ~40k rows a day.
+    # python3 bench_parquet.py --countries 4 --days 1
+    parser = argparse.ArgumentParser(description="Benchmark the Parquet settings.")
+    parser.add_argument("--countries", type=int, default=4)
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--date", default="2023-05-24")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,180 @@
+import argparse
+import io
+import json
+import pandas as pd
+import time
+import tracemalloc
+
+# Adds the scripts to the path, import before the app modules.
+from synthetic import SpotifyMock, generate_responses, join_frames, transform_responses
+from main import write_parquet
+from spotifyapp import SpotifyApp
+from spotifydata import SpotifyData
+from spotifyregion import SpotifyRegion
+
+
+def measure(func, setup=tuple, repeat: int = 3) -> tuple:
+    """
+    Return the best time of 'repeat' calls of func and the peak
+    memory allocated during one more, traced, call.
+
+    setup   = Set the function returning the arguments of each call,
+            it is not timed.
+
+    The peak memory counts Python and NumPy allocations, the buffers
+    Arrow allocates itself are not traced.
+    """
+    timings = list()
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+
+    args = setup()
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak
+
+
+def shift_days(df: pd.DataFrame, days: int) -> pd.DataFrame:
+    """
+    Repeat a day of merged data over consecutive days.
+    """
+    frames = list()
+    for day in range(days):
+        frame = df.copy()
+        if pd.api.types.is_datetime64_any_dtype(frame["featured"]):
+            frame["featured"] = frame["featured"] + pd.Timedelta(days=day)
+        else:
+            featured = pd.to_datetime(frame["featured"]) + pd.Timedelta(days=day)
+            frame["featured"] = featured.dt.strftime("%Y-%m-%dT%H:%M:%S")
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def run(args: argparse.Namespace) -> dict:
+    """
+    Generate the synthetic responses and benchmark every stage.
+    """
+    mock = SpotifyMock(
+        playlists=args.playlists,
+        catalog=args.catalog,
+        featured=args.featured,
+        markets=args.markets,
+    )
+    regions = [SpotifyRegion(r) for r in ("EU", "NASAOC", "AS", "AF")]
+    countries = [c for r in regions for c in r.country_codes][: args.countries]
+    start = time.perf_counter()
+    responses = [generate_responses(mock, country, args.date) for country in countries]
+    print(
+        f"Generated the responses of {len(countries)} countries"
+        f" in {time.perf_counter() - start:.1f}s."
+    )
+
+    app = SpotifyApp.__new__(SpotifyApp)  # No API client needed.
+    app.data = SpotifyData()
+    country_names = {k: v for r in regions for k, v in r.country_names.items()}
+    results = dict()
+
+    def record(stage: str, rows: int, func, setup=tuple) -> None:
+        seconds, peak = measure(func, setup, args.repeat)
+        results[stage] = {"rows": rows, "seconds": seconds, "peak_mib": peak / 2**20}
+        print(f"{stage:<32} {rows:>12,} {seconds:>10.3f} {peak / 2**20:>12.1f}")
+
+    print(f"{'stage':<32} {'rows':>12} {'best (s)':>10} {'peak (MiB)':>12}")
+
+    # Transform every response of an endpoint, across all countries.
+    frames = {}
+    for endpoint in ("featured_playlists", "playlists", "tracks", "audio_features"):
+        endpoint_responses = [r for c in responses for r in c[endpoint]]
+        columns = transform_responses(app.data, endpoint, endpoint_responses)
+        record(
+            f"transform_{endpoint}",
+            len(next(iter(columns.values()))),
+            lambda: transform_responses(app.data, endpoint, endpoint_responses),
+        )
+        frames[endpoint] = [
+            app.data.to_frame(endpoint, transform_responses(app.data, endpoint, c[endpoint]))
+            for c in responses
+        ]
+    for df_fp in frames["featured_playlists"]:
+        df_fp["country"] = df_fp["iso"].map(country_names)
+        df_fp["region"] = df_fp["iso"].map(regions[0].country_regions)
+    country_frames = list(zip(*frames.values()))
+
+    # Merge the dataframes of each country, as 'extract_data' does.
+    def copy_frames() -> tuple:
+        return ([[df.copy() for df in f] for f in country_frames],)
+
+    merged = [app.merge_data(*f) for f in copy_frames()[0]]
+    rows = sum(len(df) for df in merged)
+    record("merge_data", rows, lambda fs: [app.merge_data(*f) for f in fs], copy_frames)
+    if args.legacy:
+        record(
+            "merge_data (string keys)",
+            rows,
+            lambda fs: [app.convert_dtypes(join_frames(*f)) for f in fs],
+            copy_frames,
+        )
+
+    # Convert and write the data of every country over the days.
+    joined = shift_days(
+        pd.concat([join_frames(*f) for f in country_frames], ignore_index=True),
+        args.days,
+    )
+    record("convert_dtypes", len(joined), app.convert_dtypes, lambda: (joined.copy(),))
+    del joined
+
+    df = shift_days(pd.concat(merged, ignore_index=True), args.days)
+    stream = io.BytesIO()
+    write_parquet(df, stream)
+    record("write_parquet", len(df), lambda: write_parquet(df, io.BytesIO()))
+    results["write_parquet"]["bytes"] = stream.getbuffer().nbytes
+    print(f"Parquet size: {stream.getbuffer().nbytes / 2**20:.1f} MiB")
+    return results
+
+
+def compare(results: dict, path: str) -> None:
+    """
+    Print the change of every stage against saved results.
+    """
+    with open(path) as f:
+        baseline = json.load(f)
+    print(f"{'stage':<32} {'time':>10} {'peak':>10}")
+    for stage, result in results.items():
+        if stage in baseline:
+            base = baseline[stage]
+            time_change = result["seconds"] / base["seconds"] - 1
+            peak_change = result["peak_mib"] / max(base["peak_mib"], 1e-9) - 1
+            print(f"{stage:<32} {time_change:>+10.1%} {peak_change:>+10.1%}")
+    return
+
+
+if __name__ == "__main__":
+    # Time and memory profile each stage of the extraction on
+    # synthetic API responses, a country holds ~40k rows a day.
+    # python3 bench_stages.py --countries 4 --days 1
+    # python3 bench_stages.py --countries 100 --days 7  (~30M rows)
+    parser = argparse.ArgumentParser(description="Benchmark the extraction stages.")
+    parser.add_argument("--countries", type=int, default=4)
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--date", default="2023-05-24")
+    parser.add_argument("--playlists", type=int, default=2000)
+    parser.add_argument("--catalog", type=int, default=200000)
+    parser.add_argument("--featured", type=int, default=12)
+    parser.add_argument("--markets", type=int, default=180)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy", action="store_true", help="Also time the string key merge.")
+    parser.add_argument("--save", help="Save the results as JSON.")
+    parser.add_argument("--compare", help="Compare with results saved as JSON.")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
@@ -0,0 +1,100 @@
+import os
+import pandas as pd
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+from spotifydata import SpotifyData
+from spotifymock import SpotifyMock, parse_fields, select_fields
+from spotifyregion import SpotifyRegion
+
+
+def generate_responses(mock: SpotifyMock, country: str, date: str) -> dict:
+    """
+    Generate the API responses the app transforms for a country and date.
+
+    The responses are shaped as the app passes them to the transforms:
+    playlists hold every page of tracks (IDs only past the first page),
+    tracks are grouped by playlist and the audio features are a single
+    response of every unique track. A track returned for several
+    playlists is the same object, as when it is read from the store.
+    """
+    timestamps = [f"{date}T{hour:02d}:00:00" for hour in range(0, 24)]
+    featured = [
+        {"j": mock.featured_playlists(country, t, 50), "country": country, "timestamp": t}
+        for t in timestamps
+    ]
+    playlist_ids = list(
+        dict.fromkeys(
+            p["id"] for f in featured for p in f["j"]["playlists"]["items"]
+        )
+    )
+
+    page_fields = parse_fields("items(track(id))")
+    playlists, tracks, cache = list(), list(), dict()
+    for playlist_id in playlist_ids:
+        index = mock.get_index("playlist", playlist_id)
+        playlist = mock.playlist(index)
+        for offset in range(100, playlist["tracks"]["total"], 100):
+            page = select_fields(mock.playlist_tracks(index, offset, 100), page_fields)
+            playlist["tracks"]["items"].extend(page["items"])
+        playlist["tracks"]["next"] = None
+        playlists.append({"j": playlist})
+
+        track_indexes = mock.get_track_indexes(index)
+        for t in track_indexes:
+            if t not in cache:
+                cache[t] = mock.track(t)
+        tracks.append(
+            {"j": {"tracks": [cache[t] for t in track_indexes]}, "playlist_id": playlist_id}
+        )
+
+    audio_features = {"audio_features": [mock.audio_features(t) for t in cache]}
+    return {
+        "featured_playlists": featured,
+        "playlists": playlists,
+        "tracks": tracks,
+        "audio_features": [{"j": audio_features}],
+    }
+
+
+def transform_responses(data: SpotifyData, endpoint: str, responses: list) -> dict:
+    """
+    Transform every response of an endpoint into the same column buffers.
+    """
+    transform = getattr(data, f"transform_{endpoint}")
+    columns = data.get_columns(endpoint)
+    for kwargs in responses:
+        transform(columns=columns, **kwargs)
+    return columns
+
+
+def generate_frames(mock: SpotifyMock, country: str, date: str, region: str = "EU") -> tuple:
+    """
+    Generate the 4 dataframes 'SpotifyApp.extract_frames' returns.
+    """
+    data = SpotifyData()
+    responses = generate_responses(mock, country, date)
+    df_fp, df_p, df_t, df_af = (
+        data.to_frame(endpoint, transform_responses(data, endpoint, responses[endpoint]))
+        for endpoint in ("featured_playlists", "playlists", "tracks", "audio_features")
+    )
+    regions = SpotifyRegion(region)
+    df_fp["country"] = df_fp["iso"].map(regions.country_names, na_action="ignore")
+    df_fp["region"] = df_fp["iso"].map(regions.country_regions, na_action="ignore")
+    return df_fp, df_p, df_t, df_af
+
+
+def join_frames(df_fp, df_p, df_t, df_af) -> pd.DataFrame:
+    """
+    Join the 4 dataframes on their string IDs, without converting
+    the datatypes, as the app merged them before 'merge_data'.
+    """
+    merged_p = df_fp.merge(df_p, left_on="playlist_id", right_on="playlist_id")
+    merged_t = df_t.merge(df_af, left_on="track_id", right_on="track_id")
+    return (
+        merged_t.merge(merged_p, left_on="playlist_id", right_on="playlist_id")
+        .drop(columns=["playlist_tracks_ids"])
+        .reset_index(drop=True)
+        .sort_index(axis=1)
+    )
@@ -1,9 +1,18 @@
+import os
+import sys
 from datetime import datetime, timedelta
 from textwrap import dedent
 
 from airflow import DAG
+from airflow.decorators import task
+from airflow.exceptions import AirflowException
 from airflow.models import Variable
 from airflow.operators.bash import BashOperator
+from airflow.utils.trigger_rule import TriggerRule
+
+# The scripts folder is mounted next to the dags folder.
+sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+from spotifyregion import SpotifyRegion
 
 
 def get_date(frmt: str="%Y%m%d") -> str:
@@ -16,6 +25,21 @@ def get_date(frmt: str="%Y%m%d") -> str:
     yesterday = datetime.now() - timedelta(1)
     return yesterday.strftime(frmt)
 
+
+# Slots of each region's pool, see the DAG documentation.
+pool_slots = int(os.environ.get("SPOTIFY_POOL_SLOTS", 2))
+
+
+def get_commands(region: str) -> list:
+    """
+    Return an extraction command per country of a region.
+    """
+    return [
+        f"python3 /opt/airflow/scripts/main.py {region} {{{{params.date}}}} --country {iso}"
+        f" --workers 1 --processes {pool_slots} --nested"
+        for iso in SpotifyRegion(region).country_codes
+    ]
+
 # Command line argument to be passed into BashOperators
 params = { "date": get_date("%Y-%m-%d") }
 
@@ -48,8 +72,7 @@ with DAG(
         - Extract data from Spotify regions.
         - Load data into GCS bucket.
     2. Load
-        - Load data into Bigquery.
-        - Insert the data into a collective table.
+        - Load data into the date's partition of a collective table.
     
     #### Command line arguments.
     **region** = Set which region  the extraction script should limit itself too. 
@@ -63,45 +86,61 @@ with DAG(
     **date** = Set which date the extraction should collect data from. 
     *Note Spotify only keeps a backlog of 6 days.*
 
+    Every region task is mapped over the countries of the region,
+    a country is extracted and retried on its own. The tasks of a
+    region take the slots of the region's pool, *spotify_api_REGION*,
+    and each paces its requests to an equal share of the rate limits
+    of the region's apps.
+
     #### Formatting.
     The data is stored as a Parquet file, with a file convention
     of *ISO-YYYYMMDD.parquet* and within folder structure based
     on the *date*.
 
-    The data is inserted to a *denormalized nested-repeated* table. 
+    The files are written in the schema of the collective table and
+    loaded straight into the date's partition, replacing it.
+    The data is loaded to a *denormalized nested-repeated* table. 
     The table is *partitioned* by **date** and *clustered* by **region**
     first and country **ISO code** secondly.
     """
     )
      
-    el_africa = BashOperator(
+    # Map an extraction task over every country of a region.
+    el_africa = BashOperator.partial(
         task_id="el_africa",
-        bash_command="python3 /opt/airflow/scripts/main.py AF {{params.date}}",
-    )
+        pool="spotify_api_af",
+    ).expand(bash_command=get_commands("AF"))
 
-    el_asia = BashOperator(
+    el_asia = BashOperator.partial(
         task_id="el_asia",
-        bash_command="python3 /opt/airflow/scripts/main.py AS {{params.date}}",
-    )
+        pool="spotify_api_as",
+    ).expand(bash_command=get_commands("AS"))
 
-    el_europe = BashOperator(
+    el_europe = BashOperator.partial(
         task_id="el_europe",
-        bash_command="python3 /opt/airflow/scripts/main.py EU {{params.date}}",
-    )
+        pool="spotify_api_eu",
+    ).expand(bash_command=get_commands("EU"))
 
-    el_other = BashOperator(
+    el_other = BashOperator.partial(
         task_id="el_other",
-        bash_command="python3 /opt/airflow/scripts/main.py NASAOC {{params.date}}",
-    )
+        pool="spotify_api_nasaoc",
+    ).expand(bash_command=get_commands("NASAOC"))
 
+    # Load the countries recorded in the manifest once every
+    # country is done, also when a country failed its retries.
     load_to_bigquery = BashOperator(
         task_id="load_to_bigquery",
-        bash_command="python3 /opt/airflow/scripts/bigqueryload.py {{params.date}}",
-    )
-    
-    insert_to_bigtable = BashOperator(
-        task_id="insert_to_bigtable",
-        bash_command="python3 /opt/airflow/scripts/bigqueryinsert.py {{params.date}}",
+        bash_command="python3 /opt/airflow/scripts/bigqueryload.py {{params.date}} --nested",
+        trigger_rule=TriggerRule.ALL_DONE,
     )
+
+    @task(trigger_rule=TriggerRule.ONE_FAILED, retries=0)
+    def watcher():
+        """
+        Fail the DAG run when any task has failed, the load
+        succeeds without the countries that failed.
+        """
+        raise AirflowException("Failing task because one or more upstream tasks failed.")
     
-    [el_africa, el_asia, el_europe, el_other] >> load_to_bigquery >> insert_to_bigtable 
+    [el_africa, el_asia, el_europe, el_other] >> load_to_bigquery
+    list(dag.tasks) >> watcher()
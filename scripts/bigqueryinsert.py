@@ -12,6 +12,11 @@ def insert_to_table(date: str) -> None:
     table is denormalized and includes nested-repeated columns.
     It is also partitioned by 'featured'(date) column and
     clustered by 'region' then 'iso' columns.
+
+    Kept for the flat files, loaded into the staging table by
+    'bigqueryload.py' without '--nested'. The DAG loads the nested
+    files straight into the date's partition instead, see
+    'bigqueryload.load_to_partition'.
     """
     # Construct a BigQuery client object.
     client = bigquery.Client()
@@ -1,18 +1,32 @@
+import argparse
 import datetime
-import sys
+import logging
 
-from google.cloud import bigquery
+from google.cloud import bigquery, storage
+from spotifymanifest import SpotifyManifest
+from spotifysink import SpotifyGCSSink
+
+logger = logging.getLogger(__name__)
 
 
 def load_to_table(date: str) -> None:
     """
     Load multiple files from GC Storage bucket to a BigQuery table.
+
+    Only the files recorded in the date's manifest are loaded, the
+    files of every country that has finished loading into the bucket.
     """
     # Construct a BigQuery client object.
     client = bigquery.Client()
 
-    # TODO(developer): set source_uri to the GCS bucket folder to create table from.
-    # source_path = "gs://your-bucket-name/path/to/folder/*"
+    # TODO(developer): set bucket_name to the ID of your GCS bucket.
+    # bucket_name = "your-bucket-name"
+
+    # Read the URIs of the loaded files from the date's manifest.
+    manifest = SpotifyManifest(SpotifyGCSSink(storage.Client(), bucket_name), date)
+    source_uri = manifest.get_uris()
+    if not source_uri:
+        raise RuntimeError(f"No files recorded in the manifest {manifest.name}, aborting.")
 
     # TODO(developer): set table_id to the ID of the table to create.
     # table_id = "your-project-id.your_dataset.your_table_name"
@@ -38,11 +52,89 @@ def load_to_table(date: str) -> None:
     destination_table.expires = expiration
     client.update_table(destination_table, ["expires"])  # API request.
     """
-    print(f"Data uploaded from {source_uri} to Bigquery table {table_id}")
+    logger.info(
+        "Data uploaded from %s files in %s to Bigquery table %s",
+        len(source_uri),
+        manifest.name,
+        table_id,
+    )
+    return
+
+
+def load_to_partition(
+    date: str,
+    client: bigquery.Client = None,
+    storage_client: storage.Client = None,
+) -> None:
+    """
+    Load the nested files of a date into its partition of the
+    collective data table, without a staging table.
+
+    The files are written by 'main.py --nested' in the nested-repeated
+    schema of the table, the job loads them into the partition of the
+    date ('table$YYYYMMDD') and replaces its content. Loading the same
+    date again gives the same partition, the load is idempotent.
+
+    client, storage_client  = Set the BigQuery and the GC Storage
+                            clients, constructed when left empty.
+    """
+    # Construct a BigQuery client object.
+    client = client or bigquery.Client()
+
+    # TODO(developer): set bucket_name to the ID of your GCS bucket.
+    # bucket_name = "your-bucket-name"
+
+    # Read the URIs of the nested files from the date's manifest.
+    sink = SpotifyGCSSink(storage_client or storage.Client(), bucket_name)
+    manifest = SpotifyManifest(sink, date)
+    source_uri = manifest.get_uris("nested")
+    if not source_uri:
+        raise RuntimeError(f"No nested files recorded in the manifest {manifest.name}, aborting.")
+
+    # TODO(developer): set destination_table to the ID of the table to load into.
+    # destination_table = "your-project-id.your_dataset.your_table_name"
+
+    # The table is created on the first load, partitioned
+    # by 'featured'(date) and clustered by 'region' then 'iso'.
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.PARQUET,
+        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+        time_partitioning=bigquery.TimePartitioning(field="featured"),
+        clustering_fields=["region", "iso"],
+    )
+    # Load the 'list.element' lists of the files as repeated fields.
+    parquet_options = bigquery.ParquetOptions()
+    parquet_options.enable_list_inference = True
+    job_config.parquet_options = parquet_options
+
+    partition = f"{destination_table}${manifest.date}"
+    load_job = client.load_table_from_uri(
+        source_uri, partition, job_config=job_config
+    )  # Make an API request.
+
+    load_job.result()  # Waits for the job to complete.
+
+    logger.info(
+        "Data uploaded from %s files in %s to Bigquery partition %s",
+        len(source_uri),
+        manifest.name,
+        partition,
+    )
     return
 
 
 if __name__ == "__main__":
-    load_to_table(
-        date=sys.argv[1],
+    parser = argparse.ArgumentParser(description="Load the featured data of a date.")
+    parser.add_argument("date", help="The date(YYYY-MM-DD) of the featured data.")
+    parser.add_argument(
+        "--nested",
+        action="store_true",
+        help="Load the nested files straight into the date's partition.",
     )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.nested:
+        load_to_partition(date=args.date)
+    else:
+        load_to_table(date=args.date)
@@ -1,15 +1,145 @@
-import sys
+import argparse
+import logging
+import os
+import queue
+import time
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 
 from google.cloud import storage
 from spotifyapp import SpotifyApp
+from spotifycredentials import SpotifyCredentials
+from spotifyjournal import SpotifyJournal
+from spotifymanifest import SpotifyManifest
+from spotifymetrics import SpotifyMetrics, setup_logging
+from spotifyregion import SpotifyRegion
+from spotifysink import SpotifyGCSSink, SpotifyLocalSink, SpotifySink
+from spotifystore import SpotifyStore
 
+logger = logging.getLogger(__name__)
 
-def load_to_storage(
-    client: storage.Client, df: pd.DataFrame, country: str, date: str
+
+def write_parquet(
+    df: pd.DataFrame,
+    stream,
+    row_group_size: int = 100_000,
+    compression: str = "zstd",
+    compression_level: int = 3,
+    dictionary=False,
+    sort_by: tuple = None,
 ) -> None:
     """
-    Uploads a parquet file to GCS bucket.
+    Write a dataframe as a Parquet file into a writable stream.
+
+    The dataframe is converted and written one row group at
+    a time, only a single row group is held in Arrow memory.
+
+    An Arrow table, e.g. of the nested schema, is written as is
+    with its lists in the standard 'list.element' structure.
+
+    compression, compression_level  = Set the codec and its level,
+                                    the level is ignored by codecs
+                                    without one, e.g. snappy.
+
+    dictionary  = Set the dictionary encoded columns, 'strings' for the
+                string columns, a list of columns, True for every
+                column or False for none. A table with nested columns
+                encodes every column for 'strings'. The hours of a day
+                repeat the same playlists and tracks, zstd compresses
+                the plain values further than the dictionary pages.
+
+    sort_by = Set the columns the rows are sorted by, e.g. playlist_id
+            and track_id, the columns missing from the dataframe are
+            skipped. The ID range of each row group narrows, readers
+            skip the row groups without the ID they filter on. A file
+            of a country and date fits a single row group.
+    """
+    if compression is None or compression.lower() == "none" or not (
+        pa.Codec.supports_compression_level(compression)
+    ):
+        compression_level = None
+
+    is_table = isinstance(df, pa.Table)
+    schema = df.schema if is_table else pa.Schema.from_pandas(df, preserve_index=False)
+    if dictionary == "strings":
+        dictionary = any(pa.types.is_nested(f.type) for f in schema) or [
+            f.name for f in schema if pa.types.is_string(f.type)
+        ]
+
+    # Sort by the position of each row, the dataframe is not copied.
+    columns = [c for c in sort_by or () if c in schema.names]
+    order = None
+    if columns:
+        codes = [pd.factorize(np.asarray(df[c]), sort=True)[0] for c in reversed(columns)]
+        order = np.lexsort(codes)
+
+    with pq.ParquetWriter(
+        stream,
+        schema,
+        compression=compression,
+        compression_level=compression_level,
+        use_dictionary=dictionary,
+        use_compliant_nested_type=True,
+    ) as writer:
+        for i in range(0, len(df), row_group_size):
+            if order is None:
+                rows = df.slice(i, row_group_size) if is_table else df.iloc[i : i + row_group_size]
+            else:
+                rows = df.take(order[i : i + row_group_size])
+            if not is_table:
+                rows = pa.Table.from_pandas(rows, schema=schema, preserve_index=False)
+            writer.write_table(rows)
+    return
+
+
+def get_parquet_options() -> dict:
+    """
+    Return the options of the Parquet files, see 'write_parquet'.
+
+    Set by env variables, benchmarks/bench_parquet.py reports the
+    size, write and read time of each option on synthetic data.
+
+    SPOTIFY_PARQUET_COMPRESSION = Set the codec and optional level,
+                                e.g. 'zstd:3' or 'snappy'. Default: zstd:3.
+
+    SPOTIFY_PARQUET_DICTIONARY  = Set 'strings', 'all', 'none' or the
+                                columns separated by commas. Default: none.
+
+    SPOTIFY_PARQUET_ROW_GROUP   = Set the rows of a row group. Default: 100000.
+
+    SPOTIFY_PARQUET_SORT    = Set the columns to sort by separated by commas,
+                            e.g. 'playlist_id,track_id'. Default: none.
+    """
+    codec, _, level = os.environ.get("SPOTIFY_PARQUET_COMPRESSION", "zstd:3").partition(":")
+    dictionary = os.environ.get("SPOTIFY_PARQUET_DICTIONARY", "none")
+    dictionary = {"strings": "strings", "all": True, "none": False}.get(
+        dictionary, dictionary.split(",")
+    )
+    sort_by = os.environ.get("SPOTIFY_PARQUET_SORT", "")
+    return {
+        "row_group_size": int(os.environ.get("SPOTIFY_PARQUET_ROW_GROUP", 100_000)),
+        "compression": codec,
+        "compression_level": int(level) if level else None,
+        "dictionary": dictionary,
+        "sort_by": [c for c in sort_by.split(",") if c],
+    }
+
+
+def load_to_storage(
+    sink: SpotifySink,
+    df: pd.DataFrame,
+    country: str,
+    date: str,
+    region: str,
+    table: str = None,
+) -> dict:
+    """
+    Uploads a parquet file to the sink, a GCS bucket or a local dataset.
 
     Parquet file naming convention is derived from
     the country ISO code and date of featured data.
@@ -17,64 +147,150 @@ def load_to_storage(
 
     The folder structure in GCS bucket organised by date.
     Folder name convention = 'featured/YYYYMMDD'
-    """
-    # TODO(developer): set bucket_name to the ID of your GCS bucket.
-    # bucket_name = "your-bucket-name"
 
-    # TODO(developer): set the destination_blob to the ID of your GCS object.
-    # destination_blob = "storage-object-name"
+    region  = Set the region of the country, a partition
+            of the local dataset.
 
-    bucket = client.bucket(bucket_name)
-    bucket.blob(destination_blob).upload_from_string(
-        df.to_parquet(index=False), content_type=None
-    )
+    table   = Set the table of the normalized or nested output,
+            stored in a sub folder 'featured/YYYYMMDD/TABLE'.
 
-    print(
-        f"File {country}-{date}.parquet uploaded to Bucket {bucket_name}/featured/{date}"
-    )
-    return
+    The file is written into the sink's stream as it is
+    converted, row group by row group, and only appears
+    in the sink once it is complete.
+
+    Return the attributes of the file, its size and checksums.
+    """
+    name = sink.get_name(country, date, region, table)
+    with sink.open(name) as stream:
+        write_parquet(df, stream, **get_parquet_options())
+
+    logger.info("File %s uploaded to %s", name, sink.get_uri(name))
+    return sink.stat(name)
 
 
 def enable_filtering(
-    client: storage.Client, app: SpotifyApp, date: str, enable: bool = False
+    manifest: SpotifyManifest,
+    region: SpotifyRegion,
+    enable: bool = False,
+    table: str = None,
+    countries: list = None,
 ) -> list:
     """
-    Filter our previously collected data by comparing ISO codes
-    in file names. Return a list with ISO codes to base the
-    extraction script on.
+    Filter our previously collected data by reading the countries
+    recorded in the date's manifest. Return a list with ISO codes
+    to base the extraction script on.
 
-    prefix  = Lists all the blobs in the bucket that begin with the prefix.
-            This can be used to list all blobs in a "folder", e.g. "public/".
-    """
-    # TODO(developer): set bucket_name to the ID of your GCS bucket.
-    # bucket_name = "your-bucket-name"
+    region  = Set the region whose countries are extracted.
 
-    # TODO(developer): set prefix to restrict the results to given "folder".
-    # prefix = "path/to/folder"
+    table   = Set the table of the output to filter on, the countries
+            with a file of the table are left out. None for the
+            denormalized files, 'nested' for the nested files and
+            'fact' for the normalized star schema.
 
+    countries   = Set the ISO codes to limit the extraction to,
+                every country of the region when left empty.
+    """
     if enable:
-        blobs = client.list_blobs(bucket_name, prefix=prefix)
-
         # Retrieve the iso code of previously stored parquet files.
-        # Blob path = featured/YYYYMMDD/iso-YYYYMMDD.parquet
-        blob_names = [blob.name[18:20] for blob in blobs]
-        print(
-            f"Country ISO codes already stored in GCS Bucket {bucket_name}: {blob_names}"
+        # Manifest path = featured/YYYYMMDD/manifest.json
+        loaded = manifest.get_countries(table)
+        logger.info(
+            "Country ISO codes already stored in %s: %s", manifest.name, sorted(loaded)
         )
 
         # Save regional iso code that have yet to be stored in GCS bucket.
-        country_codes = [c for c in app.region.country_codes if c not in blob_names]
+        country_codes = [c for c in region.country_codes if c not in loaded]
 
     if not enable:
         # Ask for all ISO code in the regions,
         # this will overwrite previously collected files.
-        country_codes = app.region.country_codes
+        country_codes = region.country_codes
+
+    if countries:
+        country_codes = [c for c in country_codes if c in countries]
 
-    print(f"Extracting data from following countries(ISO): {country_codes}")
+    logger.info("Extracting data from following countries(ISO): %s", country_codes)
     return country_codes
 
 
-def main(region: str, date: str) -> None:
+def extract_country(
+    workers: queue.Queue,
+    manifest: SpotifyManifest,
+    country: str,
+    date: str,
+    normalized: bool = False,
+    intervals: bool = False,
+    nested: bool = False,
+) -> int:
+    """
+    Extract and load the data of a single country.
+
+    Takes a free worker, an app and a sink with a GC Storage
+    client of its own, from the queue and returns it when done.
+    The country is recorded in the manifest once all of
+    its files are loaded. Return the number of rows extracted.
+    """
+    app, sink = workers.get()
+    timer = app.metrics.timer
+    region = app.region.current_region
+    date_key = date.replace("-", "")
+    try:
+        if normalized:
+            # Extract and save the star schema into Pandas DataFrame objects.
+            frames = app.extract_normalized(country, date, intervals)
+
+            # Load each DataFrame as a Parquet file into its table folder.
+            with timer("spotify_stage_seconds", stage="load"):
+                files = [
+                    (table, load_to_storage(sink, df, country, date_key, region, table))
+                    for table, df in frames.items()
+                ]
+            rows = len(frames["fact"])
+            manifest.add_country(country, region, rows, files)
+            return rows
+
+        # Extract and save data into a Pandas DataFrame object.
+        df = app.extract_data(country, date, intervals)
+        logger.debug(
+            "Extracted %s rows, %s bytes in memory.",
+            len(df),
+            df.memory_usage(deep=True).sum(),
+            extra={"country": country, "dtypes": df.dtypes.astype(str).to_dict()},
+        )
+
+        if nested:
+            # Nest the rows into the schema of the BigQuery table.
+            with timer("spotify_stage_seconds", stage="nest"):
+                table = app.nest_data(df)
+
+            # Load the table as a Parquet file into the nested folder.
+            with timer("spotify_stage_seconds", stage="load"):
+                file = load_to_storage(sink, table, country, date_key, region, "nested")
+            manifest.add_country(country, region, len(df), [("nested", file)])
+            return len(df)
+
+        # Load DataFrame as a Parquet file directly into your GCS Bucket.
+        with timer("spotify_stage_seconds", stage="load"):
+            file = load_to_storage(sink, df, country, date_key, region)
+        manifest.add_country(country, region, len(df), [(None, file)])
+        return len(df)
+    finally:
+        workers.put((app, sink))
+
+
+def main(
+    region: str,
+    date: str,
+    normalized: bool = False,
+    workers: int = 4,
+    intervals: bool = False,
+    end: str = None,
+    countries: list = None,
+    nested: bool = False,
+    local: str = None,
+    max_workers: int = 8,
+    processes: int = 1,
+) -> None:
     """
     Run script.
 
@@ -88,34 +304,271 @@ def main(region: str, date: str) -> None:
 
     date    = Set the date(YYYY-MM-DD) to specify from
             which date the script will extract data.
+
+    normalized  = Set to True to store a compact fact file of keys
+                per country and dimension files of the playlists,
+                tracks and audio features, each entity written
+                once per date, instead of the denormalized file.
+
+    workers = Set the number of countries extracted at once. Every
+            worker has its own app and sink, all of them share
+            the region's credential pool and its rate limits.
+
+    intervals   = Set to True to store the hours a playlist was
+                featured as 'featured_from' and 'featured_to'
+                intervals instead of a row per hour, dropping
+                most of the rows. Use a single output mode
+                per date, the files of a date are loaded into
+                the same table.
+
+    end = Set the last date(YYYY-MM-DD) of a backfill, every date
+        from 'date' up to and including 'end' is extracted. The
+        (date, country) units of every date share the workers and
+        the rate limits, and the playlists and tracks fetched for
+        one date are reused by the others. Spotify keeps a backlog
+        of 6 days.
+
+    countries   = Set the ISO codes to limit the extraction to,
+                every country of the region when left empty.
+
+    nested  = Set to True to store the denormalized file in the
+            nested-repeated schema of the BigQuery table, loaded
+            straight into the date's partition by 'bigqueryload.py
+            --nested', in a sub folder 'featured/YYYYMMDD/nested'.
+
+    local   = Set a local directory to store the files and the
+            manifests in, as Hive partitioned datasets to query
+            with pyarrow or DuckDB, instead of the GCS bucket.
+
+    max_workers = Set the number of requests each worker keeps in
+                flight at once, 1 to request serially. The region's
+                credential pool paces the requests of all workers.
+
+    processes   = Set the number of processes that extract countries
+                of the region at once, e.g. the slots of the region's
+                Airflow pool. The processes share the region's apps,
+                each paces its requests to an equal share of every
+                app's rate limit.
+
+    The metrics of the run are logged as a summary when it ends and
+    written to env SPOTIFY_METRICS_PATH when set, in the Prometheus
+    text format for a '.prom' path and as JSON otherwise. The path
+    may hold '{region}' and '{date}' fields, the region is followed
+    by the countries of a run limited to some countries, e.g. 'EU-SE'.
     """
-    # Construct a Spotify app object.
-    app = SpotifyApp(region)
+    if nested and (normalized or intervals):
+        raise ValueError("The nested output holds the hourly denormalized rows only.")
 
-    # Construct a GC Storage client object.
-    client = storage.Client()
+    dates = get_dates(date, end)
+    run = dates[0] if len(dates) == 1 else f"{dates[0]}..{dates[-1]}"
 
-    # Optional(developer): set enable to True
-    # if you want to filter out previously
-    # collected data from the current run script.
-    country_codes = enable_filtering(client, app, date, enable=True)
+    # Construct an entity store object, shared by all region
+    # processes through the SPOTIFY_STORE_PATH file.
+    # Entities stored for dates older than a week are deleted.
+    store = SpotifyStore()
+    week_ago = datetime.strptime(dates[0], "%Y-%m-%d") - timedelta(7)
+    store.prune(week_ago.strftime("%Y-%m-%d"))
 
-    for country in country_codes:
-        # Extract and save data into a Pandas DataFrame object.
-        df = app.extract_data(country, date)
-        print(df.info(verbose=True))
+    # Construct a journal object of the run, a restarted run
+    # replays the requests finished before it crashed.
+    # A run limited to some countries, e.g. a mapped Airflow task,
+    # has a journal of its own, cleared when only it has finished.
+    key = "-".join([region, *sorted(countries)]) if countries else region
+    journal = SpotifyJournal(key, run)
+    journal.prune(week_ago.strftime("%Y-%m-%d"))
 
-        # Load DataFrame as a Parquet file directly into your GCS Bucket.
-        load_to_storage(client, df, country, date.replace("-", ""))
+    # Construct a credential pool and a metrics object shared by all workers.
+    credentials = SpotifyCredentials(region, share=1 / processes)
+    metrics = SpotifyMetrics()
+
+    # The playlists and tracks of a backfill are stored by the
+    # day of the run, the API returns the same ones for every date.
+    scope = datetime.now().strftime("%Y-%m-%d") if len(dates) > 1 else None
+
+    # TODO(developer): set bucket_name to the ID of your GCS bucket.
+    # bucket_name = "your-bucket-name"
+
+    def get_sink() -> SpotifySink:
+        if local:
+            return SpotifyLocalSink(local)
+        return SpotifyGCSSink(storage.Client(), bucket_name)
 
-    print(
-        f"Extraction script for region {region} on date {date} finished successfully."
+    # Construct a Spotify app and a sink with a GC Storage client per worker.
+    pool = queue.Queue()
+    for _ in range(workers):
+        app = SpotifyApp(
+            region,
+            max_workers=max_workers,
+            credentials=credentials,
+            store=store,
+            metrics=metrics,
+            journal=journal,
+            scope=scope,
+        )
+        pool.put((app, get_sink()))
+
+    # Schedule a (date, country) unit for every country
+    # of every date that is yet to be extracted in the output.
+    table = "fact" if normalized else "nested" if nested else None
+    units = list()
+    for unit_date in dates:
+        # Construct a manifest object of the date, shared by all workers,
+        # which take turns using its sink.
+        manifest = SpotifyManifest(get_sink(), unit_date)
+
+        # Optional(developer): set enable to True
+        # if you want to filter out previously
+        # collected data from the current run script.
+        country_codes = enable_filtering(
+            manifest,
+            SpotifyRegion(region),
+            enable=True,
+            table=table,
+            countries=countries,
+        )
+        units.extend((manifest, unit_date, country) for country in country_codes)
+
+    failed = list()
+    start = time.monotonic()
+    with ThreadPoolExecutor(workers) as executor:
+        futures = {
+            executor.submit(
+                extract_country,
+                pool,
+                manifest,
+                country,
+                unit_date,
+                normalized,
+                intervals,
+                nested,
+            ): (unit_date, country)
+            for manifest, unit_date, country in units
+        }
+        for i, future in enumerate(as_completed(futures), start=1):
+            unit_date, country = futures[future]
+            extra = {"date": unit_date, "country": country, "progress": f"{i}/{len(futures)}"}
+            try:
+                rows = future.result()
+            except Exception as error:
+                failed.append((unit_date, country))
+                metrics.increment("spotify_countries_total", status="failed")
+                logger.error(
+                    "[%s/%s] Country %s on %s failed: %r",
+                    i, len(futures), country, unit_date, error,
+                    extra=extra,
+                )
+            else:
+                metrics.increment("spotify_countries_total", status="finished")
+                metrics.increment("spotify_rows_total", rows)
+                logger.info(
+                    "[%s/%s] Country %s on %s finished with %s rows (%.0f seconds elapsed).",
+                    i, len(futures), country, unit_date, rows, time.monotonic() - start,
+                    extra={**extra, "rows": rows},
+                )
+
+    # Every worker has returned its app, shut down their request threads.
+    while not pool.empty():
+        app, _ = pool.get()
+        app.close()
+
+    log_summary(metrics, time.monotonic() - start)
+    path = os.environ.get("SPOTIFY_METRICS_PATH")
+    if path:
+        metrics.write(path.format(region=key, date=run))
+
+    if failed:
+        raise RuntimeError(f"Extraction failed for (date, country ISO): {failed}")
+
+    # Every country is loaded, the run will not be resumed.
+    journal.clear()
+
+    logger.info(
+        "Extraction script for region %s on date %s finished successfully.", region, run
+    )
+    return
+
+
+def get_dates(start: str, end: str = None) -> list:
+    """
+    Return the dates(YYYY-MM-DD) from start up to and including end.
+    """
+    first = datetime.strptime(start, "%Y-%m-%d")
+    last = datetime.strptime(end, "%Y-%m-%d") if end else first
+    if last < first:
+        raise ValueError(f"The end date {end} is before the start date {start}.")
+    backlog = 6  # Days of featured playlists kept by Spotify.
+    if (datetime.now() - first).days > backlog:
+        logger.warning(
+            "Spotify keeps a backlog of %s days, the playlists featured on %s"
+            " may no longer be available.",
+            backlog,
+            start,
+        )
+    return [
+        (first + timedelta(days)).strftime("%Y-%m-%d")
+        for days in range((last - first).days + 1)
+    ]
+
+
+def log_summary(metrics: SpotifyMetrics, elapsed: float) -> None:
+    """
+    Log where the time of the run went: requests by endpoint,
+    retries, bytes received, limiter waits and stage timings.
+    """
+    summary = metrics.to_json()
+    logger.info(
+        "Run finished in %.0f seconds: %.0f requests, %.0f rate limited (429),"
+        " %.0f retries, %.1f MiB received, %.0f seconds waiting for the limiter.",
+        elapsed,
+        metrics.get_total("spotify_requests_total"),
+        metrics.get_total("spotify_requests_total", status=429),
+        metrics.get_total("spotify_retries_total"),
+        metrics.get_total("spotify_response_bytes_total") / 2**20,
+        metrics.get_total("spotify_limiter_wait_seconds_total"),
+        extra={"summary": summary},
     )
+    for name in ("spotify_request_duration_seconds", "spotify_stage_seconds"):
+        for h in summary["histograms"].get(name, []):
+            logger.info(
+                "%s %s: count %s, total %.1fs, mean %.3fs, p95 %.3fs.",
+                name, h["labels"], h["count"], h["sum"], h["mean"], h["p95"],
+            )
     return
 
 
 if __name__ == "__main__":
-    main(
-        region=sys.argv[1].upper(),
-        date=sys.argv[2],
+    # Extract a date, or backfill a range of dates.
+    # python3 main.py EU 2023-05-26
+    # python3 main.py EU 2023-05-20 --end 2023-05-26 --workers 8
+    parser = argparse.ArgumentParser(description="Extract the featured data of a region.")
+    parser.add_argument("region", type=str.upper, choices=["AF", "AS", "EU", "NASAOC"])
+    parser.add_argument("date", help="The date(YYYY-MM-DD), the first date of a backfill.")
+    parser.add_argument("--end", help="Backfill every date up to and including YYYY-MM-DD.")
+    parser.add_argument(
+        "--country",
+        action="append",
+        type=str.upper,
+        dest="countries",
+        help="Extract only the country ISO code, repeat for several.",
     )
+    parser.add_argument("--workers", type=int, default=4, help="Countries extracted at once.")
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=8,
+        help="Requests each worker keeps in flight at once.",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Processes extracting the region at once, see main().",
+    )
+    parser.add_argument("--normalized", action="store_true")
+    parser.add_argument("--intervals", action="store_true")
+    parser.add_argument("--nested", action="store_true")
+    parser.add_argument("--local", help="Store the files in a local directory, not in GCS.")
+    args = parser.parse_args()
+
+    setup_logging()
+    main(**vars(args))
@@ -1,9 +1,16 @@
+import numpy as np
 import os
 import pandas as pd
+import pyarrow as pa
 
+from concurrent.futures import ThreadPoolExecutor
 from spotifyclient import SpotifyClient
 from spotifydata import SpotifyData
+from spotifycredentials import SpotifyCredentials
+from spotifyjournal import SpotifyJournal
+from spotifymetrics import SpotifyMetrics
 from spotifyregion import SpotifyRegion
+from spotifystore import SpotifyStore
 
 class SpotifyApp:
     """
@@ -16,15 +23,75 @@ class SpotifyApp:
             -- AS = Asia
             -- EU = Europe
             -- NASAOC = North America, South America and Oceania
+
+    max_workers = Set the number of requests the app keeps in
+                flight at once. The default of 1 extracts the
+                data serially, one request after another.
+                Call 'close', or use the app as a context
+                manager, to shut down its request threads.
+
+    credentials = Set the pool of app credentials shared by all
+                requests, read from the region when left empty.
+
+    store   = Set the entity store shared by all countries and
+            regions, entities are fetched once per date and
+            playlist snapshots are kept between runs. Every
+            entity is requested from the API when left empty.
+
+    metrics = Set the metrics the requests and the time spent in
+            each stage of the extraction are recorded in, pass
+            the same metrics to every app of a run.
+
+    journal = Set the journal of the run, the finished requests of
+            a crashed run are replayed when it is restarted.
+
+    scope   = Set the scope playlists and tracks are stored in, the
+            date of the extraction when left empty. The API returns
+            the current playlists and tracks whatever the date, a
+            backfill of several dates stores them by the day of the
+            run so every date reuses them.
     """
 
-    def __init__(self, region: str) -> None:
-        self.client = SpotifyClient(region) # Makes the API requests.
+    def __init__(
+        self,
+        region: str,
+        max_workers: int = 1,
+        credentials: SpotifyCredentials = None,
+        store: SpotifyStore = None,
+        metrics: SpotifyMetrics = None,
+        journal: SpotifyJournal = None,
+        scope: str = None,
+    ) -> None:
+        self.metrics = metrics or SpotifyMetrics()
+        self.client = SpotifyClient(        # Makes the API requests.
+            region, max_workers, credentials, store, self.metrics, journal
+        )
         self.data = SpotifyData()           # Perfroms the filtering.
         self.region = SpotifyRegion(region) # Maps selected countries.
+        self.store = store                  # Reuses fetched entities.
+        self.scope = scope
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers)
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+        return
+
+    def close(self) -> None:
+        """
+        Shut down the request threads and close the connections to the API.
+        """
+        self.executor.shutdown()
+        self.client.close()
         return
 
-    def extract_data(self, country: str, date: str) -> pd.DataFrame:
+    def extract_data(
+        self, country: str, date: str, intervals: bool = False
+    ) -> pd.DataFrame:
         """
         Main extraction script.
         
@@ -46,8 +113,28 @@ class SpotifyApp:
 
         audio_features  = stores data about the track's nature 
                         in terms of audio quallity.
+
+        intervals   = Set to True to store the hours a playlist was
+                    featured as intervals, 'featured_from' until
+                    'featured_to', instead of a row per hour. See
+                    'collapse_featured'.
+        """
+        frames = self.extract_frames(country, date, intervals)
+        with self.metrics.timer("spotify_stage_seconds", stage="merge"):
+            return self.merge_data(*frames)
+
+    def extract_frames(
+        self, country: str, date: str, intervals: bool = False
+    ) -> tuple:
         """
-        df_fp = self.extract_featured_playlists(country, date)
+        Extract the 4 dataframes described in 'extract_data'.
+
+        The time spent extracting each dataframe is recorded
+        in the 'spotify_stage_seconds' histogram, by stage.
+        """
+        timer = self.metrics.timer
+        with timer("spotify_stage_seconds", stage="featured_playlists"):
+            df_fp = self.extract_featured_playlists(country, date)
         
         # Insert country and region columns 
         # based on ISO code of df column.
@@ -57,124 +144,501 @@ class SpotifyApp:
         df_fp["region"] = df_fp["iso"].map(
             self.region.country_regions, na_action="ignore"
         )
+        if intervals:
+            df_fp = self.collapse_featured(df_fp)
 
         # Filter out duplicate playlist IDs 
         # before extracting playlist data.
-        df_p = self.extract_playlists(df_fp["playlist_id"].unique())
+        with timer("spotify_stage_seconds", stage="playlists"):
+            df_p = self.extract_playlists(df_fp["playlist_id"].unique(), date)
 
         # Retrieve the list of tracks for each 
         # unique playlist featured. Extract 
         # tracks that appear on featured playlist.
-        t_data = list()
         p_data = dict(zip(df_p["playlist_id"], df_p["playlist_tracks_ids"]))
-        for key, value in p_data.items():
-            df = self.extract_tracks(value)
-            t_data.append(df.assign(playlist_id=key))
-        df_t = pd.concat(t_data)
+        with timer("spotify_stage_seconds", stage="tracks"):
+            df_t = self.extract_tracks(p_data, date)
 
         # Filter out duplicate track IDs 
         # before extracting audio data.
-        df_af = self.extract_audio_features(df_t["track_id"].unique())
+        with timer("spotify_stage_seconds", stage="audio_features"):
+            df_af = self.extract_audio_features(df_t["track_id"].unique(), date)
+
+        return df_fp, df_p, df_t, df_af
+
+    # Dimension dataframes of the normalized output, by ID column.
+    dimensions = {
+        "playlists": "playlist_id",
+        "tracks": "track_id",
+        "audio_features": "track_id",
+    }
+
+    def extract_normalized(
+        self, country: str, date: str, intervals: bool = False
+    ) -> dict:
+        """
+        Extract the data as a normalized star schema.
+
+        Return a dictionary of dataframes:
+        fact    = stores the keys (featured, iso, playlist_id and
+                track_id) of every track featured in the country,
+                the same rows as 'extract_data'. Intervals replace
+                'featured' when 'intervals' is set.
+
+        playlists, tracks, audio_features   = store one row per
+                                            entity, leaving out the
+                                            entities another country
+                                            or region has claimed for
+                                            the date. A retry of the
+                                            country keeps its claims.
+        """
+        df_fp, df_p, df_t, df_af = self.extract_frames(country, date, intervals)
 
-        # Merge dataframes.
-        merged_p = df_fp.merge(df_p, left_on="playlist_id", right_on="playlist_id")
-        merged_t = df_t.merge(df_af, left_on="track_id", right_on="track_id")
-        df_merged = (
-            merged_t.merge(merged_p, left_on="playlist_id", right_on="playlist_id")
-            .drop(columns=["playlist_tracks_ids"])
-            .reset_index(drop=True)
-            .sort_index(axis=1)
+        with self.metrics.timer("spotify_stage_seconds", stage="normalize"):
+            featured = ["featured_from", "featured_to"] if intervals else ["featured"]
+            fact = df_fp[featured + ["iso", "playlist_id"]].merge(
+                df_t[["playlist_id", "track_id"]], left_on="playlist_id", right_on="playlist_id"
+            )
+            frames = {
+                "fact": fact[fact["track_id"].isin(df_af["track_id"])],
+                "playlists": df_p.drop(columns=["playlist_tracks_ids"]),
+                "tracks": df_t.drop(columns=["playlist_id"]).drop_duplicates("track_id"),
+                "audio_features": df_af,
+            }
+            # Claim the entities before they are written, each
+            # is written by the first country to claim it.
+            for name, column in self.dimensions.items():
+                df = frames[name]
+                if self.store:
+                    claimed = self.store.claim_entities(
+                        f"written_{name}", list(df[column]), date, claimant=country
+                    )
+                    frames[name] = df[df[column].isin(claimed)]
+
+            return {
+                name: self.convert_dtypes(df.reset_index(drop=True))
+                for name, df in frames.items()
+            }
+
+    # Period between the featured playlist samples of a day.
+    sample_period = pd.Timedelta(hours=1)
+
+    def collapse_featured(self, df_fp: pd.DataFrame) -> pd.DataFrame:
+        """
+        Collapse the hourly featured playlists into validity intervals.
+
+        The consecutive hours a playlist is featured in a country become
+        a single row, featured from the first hour ('featured_from') until
+        the hour after the last ('featured_to', excluded). Featured lists
+        change a few times a day, most hourly rows are copies. Every hour
+        is kept, an interval covers the hours from 'featured_from' up to
+        'featured_to' by 'sample_period'.
+        """
+        keys = ["iso", "playlist_id"]
+        df = (
+            df_fp.assign(featured=pd.to_datetime(df_fp["featured"]))
+            .drop_duplicates(keys + ["featured"])
+            .sort_values(keys + ["featured"])
         )
 
-        return self.convert_dtypes(df_merged)   # Convert to parquet datatypes.
+        # An interval starts where the playlist was not featured
+        # in the country at the sample before.
+        previous = df.shift()
+        starts = (
+            (df["iso"] != previous["iso"])
+            | (df["playlist_id"] != previous["playlist_id"])
+            | (df["featured"] - previous["featured"] != self.sample_period)
+        )
+        columns = {c: (c, "first") for c in df if c != "featured"}
+        intervals = df.groupby(starts.cumsum().to_numpy(), sort=False).agg(
+            featured_from=("featured", "first"),
+            featured_to=("featured", "last"),
+            **columns,
+        )
+        intervals["featured_to"] += self.sample_period
+        return intervals.reset_index(drop=True)
+
+    def merge_data(
+        self,
+        df_fp: pd.DataFrame,
+        df_p: pd.DataFrame,
+        df_t: pd.DataFrame,
+        df_af: pd.DataFrame,
+    ) -> pd.DataFrame:
+        """
+        Merge the 4 dataframes into a single denormalized dataframe.
+
+        The datatypes are converted on the small dataframes before
+        merging, so the work scales with the number of unique
+        playlists and tracks rather than the merged rows. Strings
+        are converted last, pandas validates them on every copy.
+
+        The merge joins integer surrogate keys, the row position of
+        each playlist and track ID in their own dataframe, then
+        gathers the columns of every dataframe by row position.
+        """
+        df_fp, df_p, df_t, df_af = (
+            self.convert_dtypes(df, strings=False) for df in (df_fp, df_p, df_t, df_af)
+        )
+
+        p_keys = pd.Index(df_p["playlist_id"])
+        t_keys = pd.Index(df_af["track_id"])
+        fp_p_key = p_keys.get_indexer(df_fp["playlist_id"])
+        t_p_key = p_keys.get_indexer(df_t["playlist_id"])
+        t_t_key = t_keys.get_indexer(df_t["track_id"])
+
+        # Join the featured playlists with their tracks, rows without
+        # a matching playlist or audio features (-1) are left out.
+        t_rows = np.flatnonzero((t_p_key >= 0) & (t_t_key >= 0))
+        keys = pd.DataFrame(
+            {"p_key": fp_p_key, "fp_row": np.arange(len(df_fp))}
+        ).merge(pd.DataFrame({"p_key": t_p_key[t_rows], "t_row": t_rows}))
+
+        df_p = df_p.drop(columns=["playlist_id", "playlist_tracks_ids"])
+        df_t = df_t.drop(columns=["playlist_id"])
+        df_af = df_af.drop(columns=["track_id"])
+        df_merged = pd.concat(
+            [
+                df.take(rows).reset_index(drop=True)
+                for df, rows in (
+                    (df_fp, keys["fp_row"]),
+                    (df_p, keys["p_key"]),
+                    (df_t, keys["t_row"]),
+                    (df_af, t_t_key[keys["t_row"]]),
+                )
+            ],
+            axis=1,
+        ).sort_index(axis=1)
+
+        strings = {k: v for k, v in self.get_dtypes().items() if v == "string"}
+        return df_merged.astype(strings)
+
+    def nest_data(self, df: pd.DataFrame) -> pa.Table:
+        """
+        Nest the denormalized dataframe into the nested-repeated
+        schema of the BigQuery table.
+
+        A row per featured timestamp and country, with a repeated
+        'playlist' record of the playlists featured at the time.
+        Each playlist holds a repeated 'track' record, and every
+        track an 'artist', an 'album' and an 'audio' record.
+
+        The records are built from the sorted rows by offsets, the
+        first row of a playlist or of a timestamp and country holds
+        the columns of its record.
+        """
+        if "featured" not in df:
+            raise ValueError("The nested schema needs the hourly 'featured' rows, not intervals.")
+
+        keys = ["featured", "iso", "playlist_id"]
+        df = df.sort_values(keys, kind="stable", ignore_index=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+
+        # The first rows of every playlist and of every timestamp and country.
+        p_rows = np.flatnonzero((df[keys] != df[keys].shift()).any(axis=1))
+        r_rows = np.flatnonzero((df[keys[:2]] != df[keys[:2]].shift()).any(axis=1))
+
+        def record(columns: list, rows: np.ndarray = None) -> list:
+            arrays = [table.column(c).combine_chunks() for c in columns]
+            return arrays if rows is None else [a.take(rows) for a in arrays]
+
+        def struct(arrays: list, names: list) -> pa.StructArray:
+            return pa.StructArray.from_arrays(arrays, names=names)
+
+        nested = self.get_nested_columns()
+        track = struct(
+            record(nested["track"])
+            + [struct(record(nested[name]), nested[name]) for name in ("artist", "album", "audio")],
+            nested["track"] + ["artist", "album", "audio"],
+        )
+        tracks = pa.ListArray.from_arrays(
+            pa.array(np.append(p_rows, len(df)), pa.int32()), track
+        )
+        playlist = struct(
+            record(nested["playlist"], p_rows) + [tracks],
+            nested["playlist"] + ["track"],
+        )
+        playlists = pa.ListArray.from_arrays(
+            pa.array(np.append(np.searchsorted(p_rows, r_rows), len(p_rows)), pa.int32()),
+            playlist,
+        )
+
+        # The featured timestamps are the local times of the country,
+        # stored as UTC like the flat files loaded into BigQuery.
+        featured = table.column("featured").cast(pa.timestamp("us", tz="UTC")).take(r_rows)
+        return pa.Table.from_arrays(
+            [featured] + record(["region", "iso", "country"], r_rows) + [playlists],
+            names=["featured", "region", "iso", "country", "playlist"],
+        )
+
+    def get_nested_columns(self) -> dict:
+        """
+        Return the columns of every record of the nested schema,
+        in the column order of the BigQuery table.
+        """
+        return {
+            "playlist": [
+                "playlist_id",
+                "playlist_name",
+                "playlist_followers_total",
+                "playlist_tracks_total",
+            ],
+            "track": [
+                "track_id",
+                "track_name",
+                "track_popularity",
+                "track_duration",
+                "track_explicit",
+            ],
+            "artist": [
+                "track_artist_id",
+                "track_artist_name",
+            ],
+            "album": [
+                "track_album_id",
+                "track_album_name",
+                "track_album_type",
+                "track_album_release",
+            ],
+            "audio": [
+                "track_audio_acousticness",
+                "track_audio_danceability",
+                "track_audio_energy",
+                "track_audio_instrumentalness",
+                "track_audio_liveness",
+                "track_audio_loudness",
+                "track_audio_mode",
+                "track_audio_speechiness",
+                "track_audio_tempo",
+                "track_audio_time_signature",
+                "track_audio_tonality",
+                "track_audio_valence",
+            ],
+        }
+
+    def map_requests(self, func, *iterables) -> list:
+        """
+        Call func on every item of the iterables, keeping up to
+        'max_workers' calls in flight at once.
+
+        The results are returned in the same order as the input,
+        so the dataframes are identical to a serial extraction.
+        """
+        if self.max_workers > 1:
+            return list(self.executor.map(func, *iterables))
+        return list(map(func, *iterables))
 
     # Extraction methods.
     def extract_featured_playlists(self, country: str, date: str) -> pd.DataFrame:
         """
         Extract data from the API featured playlist endpoint.
         """
-        sample_list = list()
-        for hour in range(0, 24):
-            timestamp = f"{date}T{hour:02d}:00:00"
-            response_json = self.client.get_featured_playlists(country, timestamp)
-            sample = self.data.transform_featured_playlists(
-                response_json, country, timestamp
+        timestamps = [f"{date}T{hour:02d}:00:00" for hour in range(0, 24)]
+        responses = self.map_requests(
+            self.client.get_featured_playlists, [country] * 24, timestamps
+        )
+        columns = self.data.get_columns("featured_playlists")
+        for response_json, timestamp in zip(responses, timestamps):
+            self.data.transform_featured_playlists(
+                response_json, country, timestamp, columns
             )
-            sample_list.append(pd.DataFrame(sample))
-        return pd.concat(sample_list)
+        return self.data.to_frame("featured_playlists", columns)
 
-    def extract_playlists(self, playlist_ids: list) -> pd.DataFrame:
+    def extract_playlists(self, playlist_ids: list, date: str) -> pd.DataFrame:
         """
         Extract data from Spotify playlist endpoint.
         """
-        sample_list = list()
+        playlists = self.fetch_entities(
+            "playlists", playlist_ids, date, self.request_playlists
+        )
+        columns = self.data.get_columns("playlists")
         for playlist_id in playlist_ids:
-            response_json = self.client.get_playlists(playlist_id)
-            sample = self.data.transform_playlists(response_json)
-            sample_list.append(pd.DataFrame(sample))
-        return pd.concat(sample_list)
+            self.data.transform_playlists(playlists[playlist_id], columns)
+        return self.data.to_frame("playlists", columns)
 
-    def extract_tracks(self, track_ids: list) -> pd.DataFrame:
+    def extract_tracks(self, playlist_tracks: dict, date: str) -> pd.DataFrame:
         """
         Extract data from Spotify several tracks endpoint.
+
+        playlist_tracks = Set the list of track IDs by playlist ID.
+
+        The track IDs of every playlist are deduplicated and requested
+        in full batches, each track is fetched and transformed once.
+        The rows of each playlist are then gathered from the unique
+        tracks, in the order of the playlist.
         """
-        sample_list = list()
-        for i in range(0, len(track_ids), 50):
-            query = ",".join(track_ids[i : i + 50])
-            response_json = self.client.get_tracks(query)
-            sample = self.data.transform_tracks(response_json)
-            sample_list.append(pd.DataFrame(sample))
-        return pd.concat(sample_list)
+        pairs = pd.Series(playlist_tracks, dtype=object).explode()
+        track_ids = list(pairs.dropna().unique())
+        tracks = self.fetch_entities("tracks", track_ids, date, self.request_tracks)
+        response_json = {"tracks": [tracks.get(t) for t in track_ids]}
+        df_t = self.data.to_frame("tracks", self.data.transform_tracks(response_json))
+
+        # Tracks that could not be fetched (-1) are left out.
+        rows = pd.Index(df_t["track_id"]).get_indexer(pairs)
+        found = rows >= 0
+        df_t = df_t.take(rows[found]).reset_index(drop=True)
+        df_t["playlist_id"] = pairs.index[found]
+        return df_t
 
-    def extract_audio_features(self, track_ids: list) -> pd.DataFrame:
+    def extract_audio_features(self, track_ids: list, date: str) -> pd.DataFrame:
         """
         Extract data from Spotify audio features endpoint.
         """
-        sample_list = list()
-        for i in range(0, len(track_ids), 100):
-            query = ",".join(track_ids[i : i + 100])
-            response_json = self.client.get_audio_features(query)
-            sample = self.data.transform_audio_features(response_json)
-            sample_list.append(pd.DataFrame(sample))
-        return pd.concat(sample_list)
+        audio_features = self.fetch_entities(
+            "audio_features", track_ids, date, self.request_audio_features
+        )
+        response_json = {"audio_features": [audio_features.get(t) for t in track_ids]}
+        columns = self.data.transform_audio_features(response_json)
+        return self.data.to_frame("audio_features", columns)
 
-    def convert_dtypes(self, df: pd.DataFrame) -> pd.DataFrame:
+    # Request methods.
+    def fetch_entities(self, kind: str, ids: list, date: str, request) -> dict:
         """
-        Assign preferred Parquet datatypes to dataframe.
+        Return the entities of a kind by Spotify ID.
+
+        Only the IDs that no country or region has fetched
+        for the date (or the app's scope) are requested from
+        the API, the rest are read from the entity store.
+        Fetched entities are cut down to the information the
+        dataframes are built from ('project_entity') first.
+
+        request = Set the request method, that takes a list of
+                IDs and returns the fetched entities by ID.
+        """
+        scope = self.scope or date
+        ids = list(dict.fromkeys(ids))  # Unique IDs, in order.
+        entities = self.store.get_entities(kind, ids, scope) if self.store else {}
+        missing = [i for i in ids if i not in entities]
+        if missing:
+            fetched = {
+                key: self.data.project_entity(kind, value)
+                for key, value in request(missing).items()
+            }
+            if self.store:
+                self.store.put_entities(kind, fetched, scope)
+            entities.update(fetched)
+        return entities
+
+    def request_playlists(self, playlist_ids: list) -> dict:
         """
-        df["featured"] = pd.to_datetime(df["featured"], errors="coerce")
-        df["track_album_release"] = pd.to_datetime(df["track_album_release"], errors="coerce").dt.date
-        return df.astype(
-            {
-                "region": "string",
-                "iso": "string",
-                "country": "string",
-                "playlist_id": "string",
-                "playlist_name": "string",
-                "playlist_followers_total": "int32",
-                "playlist_tracks_total": "int32",
-                "track_id": "string",
-                "track_name": "string",
-                "track_popularity": "int32",
-                "track_duration": "int32",
-                "track_explicit": "bool",
-                "track_artist_id": "string",
-                "track_artist_name": "string",
-                "track_album_id": "string",
-                "track_album_name": "string",
-                "track_album_type": "string",
-                "track_audio_acousticness": "float32",
-                "track_audio_danceability": "float32",
-                "track_audio_energy": "float32",
-                "track_audio_instrumentalness": "float32",
-                "track_audio_liveness": "float32",
-                "track_audio_loudness": "float32",
-                "track_audio_mode": "int32",
-                "track_audio_speechiness": "float32",
-                "track_audio_tempo": "int32",
-                "track_audio_time_signature": "int32",
-                "track_audio_tonality": "int32",
-                "track_audio_valence": "float32",
-            },
-            errors="ignore",
+        Request playlists by ID, several at once.
+
+        A playlist response holds the first page of tracks. Once all
+        playlists report their total number of tracks, the remaining
+        pages of every playlist are requested at once by offset.
+        """
+        responses = self.map_requests(self.client.get_playlists, playlist_ids)
+
+        pages = [
+            (response_json, offset)
+            for response_json in responses
+            for offset in self.get_page_offsets(response_json["tracks"])
+        ]
+        page_responses = self.map_requests(
+            self.client.get_playlist_tracks,
+            [response_json["id"] for response_json, _ in pages],
+            [offset for _, offset in pages],
         )
+        for (response_json, _), page_json in zip(pages, page_responses):
+            response_json["tracks"]["items"].extend(page_json["items"])
+            response_json["tracks"]["next"] = None
+
+        for response_json in responses:
+            self.client.save_snapshot(response_json)
+        return dict(zip(playlist_ids, responses))
+
+    def get_page_offsets(self, tracks: dict) -> range:
+        """
+        Return the offsets of the pages of tracks not yet requested.
+        """
+        if not tracks.get("next"):
+            return range(0)
+        start = tracks["offset"] + tracks["limit"]
+        return range(start, tracks["total"], 100)
+
+    def request_tracks(self, track_ids: list) -> dict:
+        """
+        Request tracks by ID in batches of 50,
+        several batches at once.
+        """
+        queries = [
+            ",".join(track_ids[i : i + 50]) for i in range(0, len(track_ids), 50)
+        ]
+        responses = self.map_requests(self.client.get_tracks, queries)
+        return {
+            t["id"]: t
+            for response_json in responses
+            for t in response_json["tracks"]
+            if t
+        }
+
+    def request_audio_features(self, track_ids: list) -> dict:
+        """
+        Request audio features by track ID in batches of 100,
+        several batches at once.
+        """
+        queries = [
+            ",".join(track_ids[i : i + 100]) for i in range(0, len(track_ids), 100)
+        ]
+        responses = self.map_requests(self.client.get_audio_features, queries)
+        return {
+            a["id"]: a
+            for response_json in responses
+            for a in response_json["audio_features"]
+            if a
+        }
+
+    def convert_dtypes(self, df: pd.DataFrame, strings: bool = True) -> pd.DataFrame:
+        """
+        Assign preferred Parquet datatypes to dataframe.
+
+        Only the columns present in the dataframe are converted.
+
+        strings = Set to False to leave the string columns as objects.
+        """
+        if "featured" in df:
+            df["featured"] = pd.to_datetime(df["featured"], errors="coerce")
+        if "track_album_release" in df:
+            df["track_album_release"] = pd.to_datetime(df["track_album_release"], errors="coerce").dt.date
+        dtypes = {
+            key: value
+            for key, value in self.get_dtypes().items()
+            if key in df and (strings or value != "string")
+        }
+        return df.astype(dtypes, errors="ignore")
+
+    def get_dtypes(self) -> dict:
+        """
+        Return the preferred Parquet datatypes by column.
+        """
+        return {
+            "region": "string",
+            "iso": "string",
+            "country": "string",
+            "playlist_id": "string",
+            "playlist_name": "string",
+            "playlist_followers_total": "int32",
+            "playlist_tracks_total": "int32",
+            "track_id": "string",
+            "track_name": "string",
+            "track_popularity": "int32",
+            "track_duration": "int32",
+            "track_explicit": "bool",
+            "track_artist_id": "string",
+            "track_artist_name": "string",
+            "track_album_id": "string",
+            "track_album_name": "string",
+            "track_album_type": "string",
+            "track_audio_acousticness": "float32",
+            "track_audio_danceability": "float32",
+            "track_audio_energy": "float32",
+            "track_audio_instrumentalness": "float32",
+            "track_audio_liveness": "float32",
+            "track_audio_loudness": "float32",
+            "track_audio_mode": "int32",
+            "track_audio_speechiness": "float32",
+            "track_audio_tempo": "int32",
+            "track_audio_time_signature": "int32",
+            "track_audio_tonality": "int32",
+            "track_audio_valence": "float32",
+        }
@@ -1,8 +1,16 @@
-import base64
+import logging
 import os
+import re
 import requests
 import time
 
+from spotifycredentials import SpotifyCredentials
+from spotifyjournal import SpotifyJournal
+from spotifymetrics import SpotifyMetrics
+from spotifystore import SpotifyStore
+
+logger = logging.getLogger(__name__)
+
 
 class SpotifyClient(requests.Session):
     """
@@ -16,137 +24,257 @@ class SpotifyClient(requests.Session):
     Note: as of '2023-05-26' requesting data from all regions in a single
     Spotify app will lead to exceeding Spotify's rate limits.
     The current solution divides the extraction between multiple apps,
-    further divisions can be made if required.
-    """
+    register more apps in a region's credential pool to scale further.
 
-    def __init__(self, region: str) -> None:
-        super().__init__()
-        self.client_id = os.environ[f"SPOTIFY_{region}_ID"]
-        self.client_secret = os.environ[f"SPOTIFY_{region}_SECRET"]
-        self.tkn_url = "https://accounts.spotify.com/api/token"
-        self.api_url = "https://api.spotify.com/v1"
-        self.request_authorization()  # Make API request.
-        return
+    pool_maxsize    = Set the number of connections kept open to
+                    the API, should match the number of requests
+                    made concurrently by the app.
 
-    def request_authorization(self) -> None:
-        """
-        Retrieve the client token credentials from the API.
-        """
-        # Encode (base64) string that contains
-        # client ID and client secret key.
-        auth_string = f"{self.client_id}:{self.client_secret}"
-        auth_bytes = auth_string.encode("utf-8")
-        auth_base64 = str(base64.b64encode(auth_bytes), "utf-8")
+    credentials = Set the pool of app credentials every request goes
+                through, pass the same pool to clients that share
+                a budget. Read from the region when left empty.
 
-        # Header and body config for token API request.
-        header = {
-            "Authorization": "Basic " + auth_base64,
-            "Content-Type": "application/x-www-form-urlencoded",
-        }
-        body = {"grant_type": "client_credentials"}
+    store   = Set the store that remembers playlist snapshots between
+            runs, unchanged playlists are not downloaded again.
 
-        response = self.request_token(header, body)
-        access_token = response.json()["access_token"]  # Expires in 3600 seconds
-        self.headers.update({"Authorization": "Bearer " + access_token})
+    metrics = Set the metrics every request is counted and timed in,
+            by endpoint. A private one is used when left empty.
 
-        print(f"Access token(3600 seconds): {access_token}")
-        return
+    journal = Set the journal of the run, finished requests are
+            recorded and replayed when the run is restarted.
 
-    def request_token(
-        self, header: dict, body: dict, retry: int = 3
-    ) -> requests.Response:
-        """
-        Send a POST request to the /api/token endpoint.
-        """
-        while retry > 0:
-            try:
-                # Make an API request
-                response = self.post(self.tkn_url, headers=header, data=body)
-            except requests.exceptions.ConnectionError as connection_error:
-                print("Connection error occured while requesting for access token.")
-            else:
-                print("Finished requesting for access token.")
-                return response
-            retry -= 1
+    The API is read from env SPOTIFY_API_URL when set, to run against
+    the offline simulator in 'spotifymock.py'.
+    """
 
-            # When requesting for a new access token the
-            # connection to the server will need to refresh/update
-            # 30 seconds between the calls should suffice.
-            print("Sleeping for 30 seconds before retrying the token request.")
-            time.sleep(30)
-        else:
-            raise RuntimeError("Max retries exceeded while requesting token, aborting.")
+    def __init__(
+        self,
+        region: str,
+        pool_maxsize: int = 10,
+        credentials: SpotifyCredentials = None,
+        store: SpotifyStore = None,
+        metrics: SpotifyMetrics = None,
+        journal: SpotifyJournal = None,
+    ) -> None:
+        super().__init__()
+        self.credentials = credentials or SpotifyCredentials(region)
+        self.store = store
+        self.metrics = metrics or SpotifyMetrics()
+        self.journal = journal
+        self.requested = set()  # Playlists requested in full, by ID.
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_maxsize)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.api_url = os.environ.get("SPOTIFY_API_URL", "https://api.spotify.com/v1")
+        for credential in self.credentials:
+            credential.token.get()  # Make API request, unless cached.
+        return
 
     def request_endpoint(self, url: str, retry: int = 3) -> requests.Response:
         """
         Send a GET request to the url endpint.
         """
+        attempt = 0
+        endpoint = self.get_endpoint(url)
         while retry > 0:
-            # Optional: limit the requests made to the API
-            # by adjusting the sleep time inbetween requests.
-            # Max: ~3 requests per second (180 per minute).
-            time.sleep(400 / 1000)
+            # Wait for a credential with headroom to allow the request.
+            start = time.perf_counter()
+            credential = self.credentials.acquire()
+            token = credential.token.get()
+            authorization = {"Authorization": "Bearer " + token}
+            self.metrics.increment(
+                "spotify_limiter_wait_seconds_total", time.perf_counter() - start
+            )
 
             try:
                 # Make an API request
-                response = self.get(url)
+                start = time.perf_counter()
+                response = self.get(url, headers=authorization)
+                self.metrics.observe(
+                    "spotify_request_duration_seconds",
+                    time.perf_counter() - start,
+                    endpoint=endpoint,
+                )
+                self.metrics.increment(
+                    "spotify_requests_total",
+                    endpoint=endpoint,
+                    status=response.status_code,
+                )
+                self.metrics.increment(
+                    "spotify_response_bytes_total",
+                    len(response.content),
+                    endpoint=endpoint,
+                )
                 response.raise_for_status()
             except requests.exceptions.HTTPError as http_error:
                 status_code = http_error.response.status_code
-                print(f"HTTP error {status_code} occured while requesting data.")
+                extra = {"endpoint": endpoint, "status": status_code, "attempt": attempt}
 
                 if status_code == 401:
-                    print("Bad or expired token, refreshing.")
+                    logger.info("Bad or expired token, refreshing.", extra=extra)
                     # Make an API rquest to refresh the client credentials
-                    self.request_authorization()
-
-                if status_code == 429:
-                    wait_period = int(response.headers["retry-after"])
-                    print(
-                        f"Retry after: {wait_period} seconds ({(wait_period/60)/60} hours)"
+                    credential.token.refresh(expired=token)
+                elif status_code == 429:
+                    wait_period = int(response.headers.get("retry-after", 1))
+                    logger.warning(
+                        "Rate limited, retry after %s seconds.",
+                        wait_period,
+                        extra={**extra, "client_id": credential.client_id},
                     )
 
                     if wait_period > 82800:  # 23 hours
                         raise RuntimeError("Exceeded rate limits, aborting.")
 
-                    for i in range(wait_period, 0, -1):  # Countdown
-                        time.sleep(1)
-                        print(f"Sleeping for {i:05d} seconds", end="\r")
-                    # Make an API rquest to refresh the client credentials
-                    self.request_authorization()
+                    # Lock the credential out until the period (plus
+                    # jitter) has passed, the retry fails over to
+                    # another credential without sleeping.
+                    limiter = credential.limiter
+                    limiter.throttle(wait_period + limiter.backoff(attempt))
+                else:
+                    logger.warning(
+                        "HTTP error %s occured while requesting data.",
+                        status_code,
+                        extra=extra,
+                    )
+                    time.sleep(credential.limiter.backoff(attempt))
+                reason = status_code
             except requests.exceptions.ConnectionError as connection_error:
-                print("Connection error occured while requesting data.")
+                logger.warning(
+                    "Connection error occured while requesting data: %r",
+                    connection_error,
+                    extra={"endpoint": endpoint, "attempt": attempt},
+                )
+                self.metrics.increment(
+                    "spotify_requests_total", endpoint=endpoint, status="connection_error"
+                )
+                time.sleep(credential.limiter.backoff(attempt))
+                reason = "connection_error"
             else:
-                print(f"Finished requesting data from endpoint:\n{url}")
+                credential.limiter.success()
+                logger.debug("Finished requesting data from endpoint: %s", url)
                 return response
             retry -= 1
+            attempt += 1
+            if retry > 0:
+                self.metrics.increment(
+                    "spotify_retries_total", endpoint=endpoint, reason=reason
+                )
         else:
             raise RuntimeError("Max retries exceeded while requesting data, aborting.")
 
+    def request_json(self, url: str) -> dict:
+        """
+        Return the status and JSON body of a GET request.
+
+        The response is recorded in the journal, a request recorded
+        by an earlier attempt of the run is replayed from it instead.
+        """
+        if self.journal:
+            response_json = self.journal.get(url)
+            if response_json:
+                self.metrics.increment(
+                    "spotify_journal_replays_total", endpoint=self.get_endpoint(url)
+                )
+                return response_json
+
+        response = self.request_endpoint(url)
+        response_json = {"status": response.status_code, "body": response.json()}
+        if self.journal:
+            self.journal.put(url, response_json)
+        return response_json
+
+    def get_endpoint(self, url: str) -> str:
+        """
+        Return the endpoint of a url, with the Spotify IDs replaced,
+        e.g. '/playlists/{id}/tracks'.
+        """
+        path = url[len(self.api_url) :].split("?")[0]
+        return re.sub(r"/[0-9A-Za-z]{22}(?=/|$)", "/{id}", path)
+
     def get_featured_playlists(self, country: str, timestamp: str) -> dict:
         """
         Get a list of Spotify featured playlists in json format.
         """
         url = f"{self.api_url}/browse/featured-playlists?country={country}&timestamp={timestamp}&limit=50"
-        return self.request_endpoint(url).json()
+        return self.request_json(url)["body"]
 
     def get_playlists(self, playlist_id: str) -> dict:
         """
         GET a playlist owned by a Spotify user.
+
+        When a snapshot of the playlist is stored, only a small probe
+        with the playlist's 'snapshot_id', name and follower counts is
+        requested. The stored track list is reused if the playlist has
+        not changed, otherwise the full playlist is requested.
         """
         url = f"{self.api_url}/playlists/{playlist_id}"
-        return self.request_endpoint(url).json()
+        snapshot = self.get_snapshot(playlist_id)
+        if snapshot:
+            fields = "id,name,snapshot_id,followers.total,tracks.total"
+            probe = self.request_json(f"{url}?fields={fields}")["body"]
+            if probe["snapshot_id"] == snapshot["playlist"]["snapshot_id"]:
+                items = snapshot["playlist"]["tracks"]["items"]
+                return {**probe, "tracks": {**probe["tracks"], "items": items}}
+
+        self.requested.add(playlist_id)
+        return self.request_json(url)["body"]
+
+    def get_playlist_tracks(self, playlist_id: str, offset: int) -> dict:
+        """
+        GET a page of (up to 100) track IDs of a playlist, by offset.
+        """
+        url = f"{self.api_url}/playlists/{playlist_id}/tracks?offset={offset}&limit=100&fields=items(track(id))"
+        return self.request_json(url)["body"]
+
+    def get_snapshot(self, playlist_id: str) -> dict:
+        """
+        Return the stored snapshot of a playlist, if any.
+        """
+        if not self.store:
+            return None
+        snapshots = self.store.get_entities("playlist_snapshots", [playlist_id], "*")
+        return snapshots.get(playlist_id)
+
+    def save_snapshot(self, playlist: dict) -> None:
+        """
+        Store a snapshot of a playlist requested in full.
+
+        Only the fields kept by the app and the track IDs are stored.
+        """
+        if playlist["id"] not in self.requested:
+            return  # Reused from the store.
+        self.requested.discard(playlist["id"])
+        if not self.store:
+            return
+        items = [
+            {"track": {"id": p["track"]["id"]}}
+            for p in playlist["tracks"]["items"]
+            if p["track"]
+        ]
+        snapshot = {
+            "playlist": {
+                "id": playlist["id"],
+                "name": playlist["name"],
+                "snapshot_id": playlist["snapshot_id"],
+                "followers": {"total": playlist["followers"]["total"]},
+                "tracks": {"total": playlist["tracks"]["total"], "items": items},
+            },
+        }
+        self.store.put_entities(
+            "playlist_snapshots", {playlist["id"]: snapshot}, "*", replace=True
+        )
+        return
 
     def get_tracks(self, track_ids: str) -> dict:
         """
         GET information for multiple tracks based on their Spotify IDs.
         """
         url = f"{self.api_url}/tracks?ids={track_ids}"
-        return self.request_endpoint(url).json()
+        return self.request_json(url)["body"]
 
     def get_audio_features(self, track_ids: str) -> dict:
         """
         GET audio features for multiple tracks based on their Spotify IDs.
         """
         url = f"{self.api_url}/audio-features?ids={track_ids}"
-        return self.request_endpoint(url).json()
+        return self.request_json(url)["body"]
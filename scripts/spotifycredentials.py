@@ -0,0 +1,75 @@
+import os
+import time
+
+from spotifylimiter import SpotifyLimiter
+from spotifytoken import SpotifyToken
+
+
+class SpotifyCredential:
+    """
+    Client credentials of a single Spotify app.
+
+    Every credential keeps its own access token and its own rate
+    limiter, Spotify accounts the rate limits per app.
+
+    share   = Set the share of the app's rate limit this process
+            paces its requests to, see SpotifyLimiter.
+    """
+
+    def __init__(self, client_id: str, client_secret: str, share: float = 1.0) -> None:
+        self.client_id = client_id
+        self.limiter = SpotifyLimiter(share=share)
+        self.token = SpotifyToken(client_id, client_secret)
+        return
+
+
+class SpotifyCredentials:
+    """
+    Pool of Spotify app credentials that share the requests of a region.
+
+    The credentials are read from the environment, the client IDs and
+    secrets of several apps are separated by commas in the same order.
+    SPOTIFY_{region}_ID="first-client-id,second-client-id"
+    SPOTIFY_{region}_SECRET="first-client-secret,second-client-secret"
+
+    Every request is sent with the credential that has the most headroom,
+    a credential locked out by a 429 response is skipped until its
+    'Retry-After' period has passed. Throughput scales with the
+    number of apps registered.
+
+    share   = Set the share of every app's rate limit this process
+            paces its requests to, see SpotifyLimiter. Default: 1.0.
+    """
+
+    def __init__(self, region: str, share: float = 1.0) -> None:
+        client_ids = os.environ[f"SPOTIFY_{region}_ID"].split(",")
+        client_secrets = os.environ[f"SPOTIFY_{region}_SECRET"].split(",")
+        if len(client_ids) != len(client_secrets):
+            raise ValueError(
+                f"SPOTIFY_{region}_ID and SPOTIFY_{region}_SECRET "
+                "hold a different number of credentials."
+            )
+        self.credentials = [
+            SpotifyCredential(client_id.strip(), client_secret.strip(), share)
+            for client_id, client_secret in zip(client_ids, client_secrets)
+        ]
+        return
+
+    def __iter__(self):
+        return iter(self.credentials)
+
+    def acquire(self) -> SpotifyCredential:
+        """
+        Take a request token from the credential with the most
+        headroom and return the credential.
+
+        Block only when every credential is out of tokens or locked out.
+        """
+        while True:
+            credential = min(
+                self.credentials,
+                key=lambda c: (c.limiter.wait_time(), -c.limiter.tokens),
+            )
+            if credential.limiter.try_acquire():
+                return credential
+            time.sleep(max(credential.limiter.wait_time(), 0.01))
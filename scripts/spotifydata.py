@@ -1,3 +1,7 @@
+import pandas as pd
+import pyarrow as pa
+
+
 class SpotifyData:
     """
     External application that uses retrieved Spotify content,
@@ -15,83 +19,210 @@ class SpotifyData:
     https://developer.spotify.com/documentation/web-api/reference/get-several-tracks
 
     https://developer.spotify.com/documentation/web-api/reference/get-several-audio-features
+
+    Every transform walks a response once and appends the information
+    to typed column buffers, all responses of an endpoint are appended
+    to the same buffers and turned into a single table with 'to_frame'.
+    The column types follow the Parquet datatypes of the app, the dates
+    are kept as strings and converted by the app.
     """
 
     def __init__(self) -> None:
+        self.schemas = {
+            "featured_playlists": pa.schema(
+                [
+                    ("playlist_id", pa.string()),
+                    ("iso", pa.string()),
+                    ("featured", pa.string()),
+                ]
+            ),
+            "playlists": pa.schema(
+                [
+                    ("playlist_id", pa.string()),
+                    ("playlist_name", pa.string()),
+                    ("playlist_followers_total", pa.int32()),
+                    ("playlist_tracks_total", pa.int32()),
+                    ("playlist_tracks_ids", pa.list_(pa.string())),
+                ]
+            ),
+            "tracks": pa.schema(
+                [
+                    ("track_id", pa.string()),
+                    ("track_name", pa.string()),
+                    ("track_popularity", pa.int32()),
+                    ("track_duration", pa.int32()),
+                    ("track_explicit", pa.bool_()),
+                    ("track_artist_id", pa.string()),
+                    ("track_artist_name", pa.string()),
+                    ("track_album_id", pa.string()),
+                    ("track_album_name", pa.string()),
+                    ("track_album_release", pa.string()),
+                    ("track_album_type", pa.string()),
+                    ("playlist_id", pa.string()),
+                ]
+            ),
+            "audio_features": pa.schema(
+                [
+                    ("track_id", pa.string()),
+                    ("track_audio_danceability", pa.float32()),
+                    ("track_audio_energy", pa.float32()),
+                    ("track_audio_tonality", pa.int32()),
+                    ("track_audio_loudness", pa.float32()),
+                    ("track_audio_mode", pa.int32()),
+                    ("track_audio_speechiness", pa.float32()),
+                    ("track_audio_acousticness", pa.float32()),
+                    ("track_audio_instrumentalness", pa.float32()),
+                    ("track_audio_liveness", pa.float32()),
+                    ("track_audio_valence", pa.float32()),
+                    ("track_audio_tempo", pa.float64()),  # Truncated by the app.
+                    ("track_audio_time_signature", pa.int32()),
+                ]
+            ),
+        }
         return
 
+    def get_columns(self, endpoint: str) -> dict:
+        """
+        Return empty column buffers for the endpoint's table.
+        """
+        return {name: list() for name in self.schemas[endpoint].names}
+
+    def to_frame(self, endpoint: str, columns: dict) -> pd.DataFrame:
+        """
+        Build a single typed dataframe from the column buffers.
+        """
+        table = pa.Table.from_pydict(columns, schema=self.schemas[endpoint])
+        return table.to_pandas()
+
+    def project_entity(self, endpoint: str, j: dict) -> dict:
+        """
+        Keep only the information of an entity that its transform reads,
+        in the same structure, before the entity is stored. The responses
+        also hold available markets, images and links, most of their size.
+        """
+        if endpoint == "playlists":
+            return {
+                "id": j["id"],
+                "name": j["name"],
+                "followers": {"total": j["followers"]["total"]},
+                "tracks": {
+                    "total": j["tracks"]["total"],
+                    "items": [
+                        {"track": {"id": p["track"]["id"]}}
+                        for p in j["tracks"]["items"]
+                        if p["track"]
+                    ],
+                },
+            }
+        if endpoint == "tracks":
+            return {
+                "id": j["id"],
+                "name": j["name"],
+                "popularity": j["popularity"],
+                "duration_ms": j["duration_ms"],
+                "explicit": j["explicit"],
+                "artists": [{"id": a["id"], "name": a["name"]} for a in j["artists"][:1]],
+                "album": {
+                    "id": j["album"]["id"],
+                    "name": j["album"]["name"],
+                    "release_date": j["album"]["release_date"],
+                    "type": j["album"]["type"],
+                },
+            }
+        if endpoint == "audio_features":
+            fields = [
+                "id",
+                "danceability",
+                "energy",
+                "key",
+                "loudness",
+                "mode",
+                "speechiness",
+                "acousticness",
+                "instrumentalness",
+                "liveness",
+                "valence",
+                "tempo",
+                "time_signature",
+            ]
+            return {f: j[f] for f in fields}
+        raise ValueError(f"No entities are stored for endpoint {endpoint}.")
+
     def transform_featured_playlists(
-        self, j: dict, country: str, timestamp: str
+        self, j: dict, country: str, timestamp: str, columns: dict = None
     ) -> dict:
         """
         Chose what information to extract from the featured playlist endpoint.
         """
-        return {
-            "playlist_id": (f["id"] for f in j["playlists"]["items"] if f),
-            "iso": country,
-            "featured": timestamp,
-        }
+        if columns is None:
+            columns = self.get_columns("featured_playlists")
+        for f in j["playlists"]["items"]:
+            if f:
+                columns["playlist_id"].append(f["id"])
+                columns["iso"].append(country)
+                columns["featured"].append(timestamp)
+        return columns
 
-    def transform_playlists(self, j: dict) -> dict:
+    def transform_playlists(self, j: dict, columns: dict = None) -> dict:
         """
         Chose what information to extract from the playlist endpoint.
         """
-        return {
-            "playlist_id": j["id"],
-            "playlist_name": j["name"],
-            "playlist_followers_total": j["followers"]["total"],
-            "playlist_tracks_total": j["tracks"]["total"],
-            "playlist_tracks_ids": [
-                [p["track"]["id"] for p in j["tracks"]["items"] if p["track"]]
-            ],
-        }
+        if columns is None:
+            columns = self.get_columns("playlists")
+        columns["playlist_id"].append(j["id"])
+        columns["playlist_name"].append(j["name"])
+        columns["playlist_followers_total"].append(j["followers"]["total"])
+        columns["playlist_tracks_total"].append(j["tracks"]["total"])
+        columns["playlist_tracks_ids"].append(
+            [p["track"]["id"] for p in j["tracks"]["items"] if p["track"]]
+        )
+        return columns
 
-    def transform_tracks(self, j: dict) -> dict:
+    def transform_tracks(
+        self, j: dict, columns: dict = None, playlist_id: str = None
+    ) -> dict:
         """
         Chose what information to extract from the tracks endpoint.
+
+        playlist_id = Set the playlist the tracks were requested for.
         """
-        return {
-            "track_id": (t["id"] for t in j["tracks"] if t),
-            "track_name": (t["name"] for t in j["tracks"] if t),
-            "track_popularity": (t["popularity"] for t in j["tracks"] if t),
-            "track_duration": (int(t["duration_ms"] / 1000) for t in j["tracks"] if t),
-            "track_explicit": (t["explicit"] for t in j["tracks"] if t),
-            "track_artist_id": (t["artists"][0]["id"] for t in j["tracks"] if t),
-            "track_artist_name": (t["artists"][0]["name"] for t in j["tracks"] if t),
-            "track_album_id": (t["album"]["id"] for t in j["tracks"] if t),
-            "track_album_name": (t["album"]["name"] for t in j["tracks"] if t),
-            "track_album_release": (
-                t["album"]["release_date"] for t in j["tracks"] if t
-            ),
-            "track_album_type": (t["album"]["type"] for t in j["tracks"] if t),
-        }
+        if columns is None:
+            columns = self.get_columns("tracks")
+        for t in j["tracks"]:
+            if t:
+                columns["track_id"].append(t["id"])
+                columns["track_name"].append(t["name"])
+                columns["track_popularity"].append(t["popularity"])
+                columns["track_duration"].append(int(t["duration_ms"] / 1000))
+                columns["track_explicit"].append(t["explicit"])
+                columns["track_artist_id"].append(t["artists"][0]["id"])
+                columns["track_artist_name"].append(t["artists"][0]["name"])
+                columns["track_album_id"].append(t["album"]["id"])
+                columns["track_album_name"].append(t["album"]["name"])
+                columns["track_album_release"].append(t["album"]["release_date"])
+                columns["track_album_type"].append(t["album"]["type"])
+                columns["playlist_id"].append(playlist_id)
+        return columns
 
-    def transform_audio_features(self, j: dict) -> dict:
+    def transform_audio_features(self, j: dict, columns: dict = None) -> dict:
         """
         Chose what information to extract from the audio features endpoint.
         """
-        return {
-            "track_id": (a["id"] for a in j["audio_features"] if a),
-            "track_audio_danceability": (
-                a["danceability"] for a in j["audio_features"] if a
-            ),
-            "track_audio_energy": (a["energy"] for a in j["audio_features"] if a),
-            "track_audio_tonality": (a["key"] for a in j["audio_features"] if a),
-            "track_audio_loudness": (a["loudness"] for a in j["audio_features"] if a),
-            "track_audio_mode": (a["mode"] for a in j["audio_features"] if a),
-            "track_audio_speechiness": (
-                a["speechiness"] for a in j["audio_features"] if a
-            ),
-            "track_audio_acousticness": (
-                a["acousticness"] for a in j["audio_features"] if a
-            ),
-            "track_audio_instrumentalness": (
-                a["instrumentalness"] for a in j["audio_features"] if a
-            ),
-            "track_audio_liveness": (a["liveness"] for a in j["audio_features"] if a),
-            "track_audio_valence": (a["valence"] for a in j["audio_features"] if a),
-            "track_audio_tempo": (a["tempo"] for a in j["audio_features"] if a),
-            "track_audio_time_signature": (
-                a["time_signature"] for a in j["audio_features"] if a
-            ),
-        }
+        if columns is None:
+            columns = self.get_columns("audio_features")
+        for a in j["audio_features"]:
+            if a:
+                columns["track_id"].append(a["id"])
+                columns["track_audio_danceability"].append(a["danceability"])
+                columns["track_audio_energy"].append(a["energy"])
+                columns["track_audio_tonality"].append(a["key"])
+                columns["track_audio_loudness"].append(a["loudness"])
+                columns["track_audio_mode"].append(a["mode"])
+                columns["track_audio_speechiness"].append(a["speechiness"])
+                columns["track_audio_acousticness"].append(a["acousticness"])
+                columns["track_audio_instrumentalness"].append(a["instrumentalness"])
+                columns["track_audio_liveness"].append(a["liveness"])
+                columns["track_audio_valence"].append(a["valence"])
+                columns["track_audio_tempo"].append(a["tempo"])
+                columns["track_audio_time_signature"].append(a["time_signature"])
+        return columns
@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+class SpotifyJournal:
+    """
+    Local journal of the finished requests of a run.
+
+    Every finished request of a run, a region and date, is recorded by
+    its url: the status and the JSON body of the response.
+    When a crashed or retried run is restarted, the recorded requests
+    are replayed from the journal and only the rest are requested from
+    the API, instead of repeating the work of every unfinished country.
+
+    A run's journal is cleared once the run has finished successfully.
+    The bodies are compressed, the responses repeat a lot of content.
+
+    The journal is a SQLite database in WAL mode, every request is
+    committed on its own so a crash loses at most the requests in flight.
+
+    region, date    = Set the run of the journal, the date of a
+                    backfill is its range 'YYYY-MM-DD..YYYY-MM-DD'.
+
+    path    = Set the path of the SQLite database file.
+            Default: env SPOTIFY_JOURNAL_PATH or 'spotify-journal.db'
+            in the temporary directory.
+    """
+
+    def __init__(self, region: str, date: str, path: str = None) -> None:
+        self.region = region
+        self.date = date
+        self.path = path or os.environ.get(
+            "SPOTIFY_JOURNAL_PATH",
+            os.path.join(tempfile.gettempdir(), "spotify-journal.db"),
+        )
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            self.path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS requests (
+                date TEXT NOT NULL,
+                region TEXT NOT NULL,
+                url TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                PRIMARY KEY (date, region, url)
+            ) WITHOUT ROWID
+            """
+        )
+        with self.lock:
+            (count,) = self.connection.execute(
+                "SELECT COUNT(*) FROM requests WHERE date = ? AND region = ?",
+                [self.date, self.region],
+            ).fetchone()
+        if count:
+            logger.info(
+                "Resuming run %s %s, replaying %s finished requests.",
+                region,
+                date,
+                count,
+                extra={"region": region, "date": date, "requests": count},
+            )
+        return
+
+    def get(self, url: str) -> dict:
+        """
+        Return the recorded response of a url, or None.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT payload FROM requests WHERE date = ? AND region = ? AND url = ?",
+                [self.date, self.region, url],
+            ).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def put(self, url: str, response: dict) -> None:
+        """
+        Record the response of a finished request.
+        """
+        payload = zlib.compress(json.dumps(response).encode("utf-8"), 1)
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO requests VALUES (?, ?, ?, ?)",
+                [self.date, self.region, url, payload],
+            )
+        return
+
+    def clear(self) -> None:
+        """
+        Delete the recorded requests of the run.
+        """
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM requests WHERE date = ? AND region = ?",
+                [self.date, self.region],
+            )
+        return
+
+    def prune(self, before: str) -> None:
+        """
+        Delete the recorded requests of every run older than 'before'.
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM requests WHERE date < ?", [before])
+        return
@@ -0,0 +1,139 @@
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SpotifyLimiter:
+    """
+    Token bucket that paces every request made to the Spotify Web API.
+
+    Each request takes a token from the bucket, the bucket refills at
+    'rate' tokens per second and holds up to 'burst' tokens. The rate
+    adapts to the responses from the API (additive-increase and
+    multiplicative-decrease):
+    -- a successful request raises the rate by 'increase'.
+    -- a 429 response multiplies the rate by 'decrease' and holds
+       every request until the 'Retry-After' period has passed.
+
+    Spotify calculates its rate limit over a rolling 30 second window,
+    further details can be read @Spotify:
+    https://developer.spotify.com/documentation/web-api/concepts/rate-limits
+
+    rate    = Set the initial number of requests per second.
+            Default: ~3 requests per second (180 per minute).
+
+    burst   = Set the number of requests that can be made at once
+            after the limiter has been idle.
+
+    min_rate, max_rate  = Set the bounds of the adaptive rate.
+
+    increase, decrease  = Set the additive step and the
+                        multiplicative factor of the rate.
+
+    share   = Set the share of the app's rate limit the limiter paces
+            to, e.g. 0.25 when four processes use the same app at
+            once. The rates, the step and the burst are scaled by it.
+    """
+
+    def __init__(
+        self,
+        rate: float = 3.0,
+        burst: int = 3,
+        min_rate: float = 0.5,
+        max_rate: float = 10.0,
+        increase: float = 0.05,
+        decrease: float = 0.5,
+        share: float = 1.0,
+    ) -> None:
+        self.rate = rate * share
+        self.burst = max(1, round(burst * share))
+        self.min_rate = min_rate * share
+        self.max_rate = max_rate * share
+        self.increase = increase * share
+        self.decrease = decrease
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+        return
+
+    def acquire(self) -> float:
+        """
+        Block until a token is available and take it.
+
+        Return the number of seconds spent waiting.
+        """
+        waited = 0.0
+        while not self.try_acquire():
+            wait = self.wait_time()
+            time.sleep(wait)
+            waited += wait
+        return waited
+
+    def try_acquire(self) -> bool:
+        """
+        Take a token if one is available, without waiting.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            if self.blocked_until <= now and self.tokens >= 1:
+                self.tokens -= 1
+                return True
+        return False
+
+    def wait_time(self) -> float:
+        """
+        Return the number of seconds until a token is available.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            refill_wait = max(0.0, (1 - self.tokens) / self.rate)
+            return max(self.blocked_until - now, refill_wait)
+
+    def refill(self, now: float) -> None:
+        """
+        Add the tokens earned since the last refill.
+        """
+        elapsed = now - self.updated
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated = now
+        return
+
+    def success(self) -> None:
+        """
+        Additively increase the rate after a successful request.
+        """
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+        return
+
+    def throttle(self, retry_after: float) -> None:
+        """
+        Multiplicatively decrease the rate after a 429 response and
+        hold every request until the 'Retry-After' period has passed.
+        """
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = 0.0
+            self.blocked_until = max(
+                self.blocked_until, time.monotonic() + retry_after
+            )
+        logger.info(
+            "Lowering request rate to %.2f/s.", self.rate, extra={"rate": self.rate}
+        )
+        return
+
+    def backoff(self, attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+        """
+        Return a jittered exponential backoff period in seconds.
+
+        The period is drawn at random between zero and the exponential
+        ceiling ('full jitter'), so retries made by concurrent requests
+        are spread out instead of arriving at the API all at once.
+        """
+        return random.uniform(0, min(cap, base * 2**attempt))
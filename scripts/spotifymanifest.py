@@ -0,0 +1,151 @@
+import datetime
+import json
+import logging
+import random
+import threading
+import time
+
+from google.api_core.exceptions import PreconditionFailed
+from spotifysink import SpotifySink
+
+logger = logging.getLogger(__name__)
+
+
+class SpotifyManifest:
+    """
+    Manifest of the countries loaded into a sink for a date.
+
+    A single small JSON object, 'featured/YYYYMMDD/manifest.json' in
+    a GCS bucket, records every country whose files have all been
+    loaded: the region, the number of rows and each file with its
+    size and checksums. The table of a file tells the outputs apart,
+    None for the denormalized file, 'nested' for the nested file and
+    the tables of the normalized star schema, e.g. 'fact'.
+
+    {
+        "date": "YYYYMMDD",
+        "countries": {
+            "SE": {
+                "region": "EU",
+                "rows": 40032,
+                "updated": "2023-05-27T01:02:03+00:00",
+                "files": [
+                    {"name": "featured/YYYYMMDD/SE-YYYYMMDD.parquet",
+                    "table": null, "size": 1234, "crc32c": "...",
+                    "md5": "...", "generation": 1685...}
+                ]
+            }
+        }
+    }
+
+    Resuming a run reads the manifest instead of listing every file of
+    the date, and the load reads the files to ingest from it.
+
+    Every update reads the manifest, changes it and writes it back on
+    the condition that nobody else has written it in the meantime (the
+    generation matches). Region processes updating the manifest at once
+    retry on a conflict, no update is lost. Within a process the worker
+    threads share the manifest, its reads and updates are serialized
+    by a lock, the sink's client is not used by two threads at once.
+
+    sink    = Set the sink of the loaded files, e.g. a SpotifyGCSSink.
+
+    date    = Set the date(YYYY-MM-DD or YYYYMMDD) of the featured data.
+    """
+
+    def __init__(self, sink: SpotifySink, date: str) -> None:
+        self.sink = sink
+        self.date = date.replace("-", "")
+        self.name = sink.get_manifest_name(self.date)
+        self.lock = threading.RLock()
+        return
+
+    def read(self) -> tuple:
+        """
+        Return the manifest and its generation, zero when the
+        manifest does not exist yet.
+        """
+        with self.lock:
+            data, generation = self.sink.read(self.name)
+        if data is None:
+            return {"date": self.date, "countries": {}}, 0
+        return json.loads(data), generation
+
+    def update(self, change, retry: int = 10) -> dict:
+        """
+        Apply a change to the manifest, atomically.
+
+        change  = Set the function that changes the manifest in place,
+                it is applied again to the latest manifest whenever
+                another process has updated it first.
+        """
+        with self.lock:
+            for attempt in range(retry):
+                manifest, generation = self.read()
+                change(manifest)
+                try:
+                    self.sink.write(
+                        self.name,
+                        json.dumps(manifest, indent=2).encode("utf-8"),
+                        generation,
+                        content_type="application/json",
+                    )
+                except PreconditionFailed:
+                    logger.info("Manifest %s was updated concurrently, retrying.", self.name)
+                    time.sleep(random.uniform(0, min(10, 0.1 * 2**attempt)))
+                else:
+                    return manifest
+        raise RuntimeError(f"Could not update the manifest {self.name}, aborting.")
+
+    def add_country(self, country: str, region: str, rows: int, files: list) -> None:
+        """
+        Record the loaded files of a country.
+
+        files   = Set the (table, file) pairs of the loaded files, the
+                attributes of the file returned by the sink's 'stat'.
+                The table is None for the denormalized file.
+
+        The recorded files of the same tables are replaced, the files
+        of the country's other outputs are kept.
+        """
+        tables = {table for table, _ in files}
+        entry = {
+            "region": region,
+            "rows": rows,
+            "updated": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "files": [{**file, "table": table} for table, file in files],
+        }
+
+        def change(manifest: dict) -> None:
+            previous = manifest["countries"].get(country, {"files": []})
+            kept = [f for f in previous["files"] if f["table"] not in tables]
+            manifest["countries"][country] = {**entry, "files": kept + entry["files"]}
+
+        self.update(change)
+        return
+
+    def get_countries(self, table: str = None) -> set:
+        """
+        Return the ISO codes of the countries loaded for the date
+        with a file of a table, the denormalized file when no table
+        is given.
+        """
+        manifest, _ = self.read()
+        return {
+            country
+            for country, entry in manifest["countries"].items()
+            if any(f["table"] == table for f in entry["files"])
+        }
+
+    def get_uris(self, table: str = None) -> list:
+        """
+        Return the URIs of the loaded files of a table, e.g. 'gs://',
+        the denormalized files when no table is given.
+        """
+        manifest, _ = self.read()
+        return [
+            self.sink.get_uri(f["name"])
+            for _, entry in sorted(manifest["countries"].items())
+            for f in entry["files"]
+            if f["table"] == table
+        ]
@@ -0,0 +1,255 @@
+import collections
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+
+class SpotifyMetrics:
+    """
+    Counters, latency histograms and stage timings of an extraction run.
+
+    Every metric has a name and optional labels, e.g. the endpoint of a
+    request. The metrics are safe to update from every thread, pass the
+    same object to every app of a run to sum up the whole run.
+
+    The metrics export in the Prometheus text format, to be scraped or
+    pushed from a textfile, or as a JSON run summary with estimated
+    latency percentiles.
+
+    buckets = Set the upper bounds, in seconds, of the histograms.
+    """
+
+    def __init__(
+        self, buckets: tuple = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    ) -> None:
+        self.buckets = buckets
+        self.counters = collections.defaultdict(float)
+        self.histograms = dict()
+        self.lock = threading.Lock()
+        return
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Add a value to a counter.
+        """
+        key = (name, get_labels(labels))
+        with self.lock:
+            self.counters[key] += value
+        return
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """
+        Count a value into the buckets of a histogram.
+        """
+        key = (name, get_labels(labels))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = {
+                    "buckets": [0] * len(self.buckets),
+                    "count": 0,
+                    "sum": 0.0,
+                    "min": value,
+                    "max": value,
+                }
+            histogram = self.histograms[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+                    break
+            histogram["count"] += 1
+            histogram["sum"] += value
+            histogram["min"] = min(histogram["min"], value)
+            histogram["max"] = max(histogram["max"], value)
+        return
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        """
+        Observe the seconds spent in the block, also when it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def quantile(self, histogram: dict, q: float) -> float:
+        """
+        Estimate a quantile of a histogram, interpolated in its bucket
+        and kept within the smallest and largest observed values.
+        """
+        rank = q * histogram["count"]
+        lower, seen, estimate = 0.0, 0, histogram["max"]
+        for bound, count in zip(self.buckets, histogram["buckets"]):
+            if count and seen + count >= rank:
+                estimate = lower + (bound - lower) * (rank - seen) / count
+                break
+            lower, seen = bound, seen + count
+        return min(max(estimate, histogram["min"]), histogram["max"])
+
+    def to_prometheus(self) -> str:
+        """
+        Return the metrics in the Prometheus text exposition format.
+        """
+        lines, typed = list(), set()
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    cumulative += count
+                    bucket_labels = labels + (("le", f"{bound:g}"),)
+                    lines.append(f"{name}_bucket{format_labels(bucket_labels)} {cumulative}")
+                inf_labels = labels + (("le", "+Inf"),)
+                lines.append(f"{name}_bucket{format_labels(inf_labels)} {histogram['count']}")
+                lines.append(f"{name}_sum{format_labels(labels)} {format_value(histogram['sum'])}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> dict:
+        """
+        Return a run summary of the metrics.
+
+        Counters and histograms are listed by name, one entry per set
+        of labels. Histograms report their count, sum, mean and the
+        estimated median, 95th and 99th percentiles.
+        """
+        summary = {
+            "counters": collections.defaultdict(list),
+            "histograms": collections.defaultdict(list),
+        }
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                summary["counters"][name].append({"labels": dict(labels), "value": value})
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                count = histogram["count"]
+                summary["histograms"][name].append(
+                    {
+                        "labels": dict(labels),
+                        "count": count,
+                        "sum": round(histogram["sum"], 3),
+                        "mean": round(histogram["sum"] / count, 3),
+                        "p50": round(self.quantile(histogram, 0.50), 3),
+                        "p95": round(self.quantile(histogram, 0.95), 3),
+                        "p99": round(self.quantile(histogram, 0.99), 3),
+                        "max": round(histogram["max"], 3),
+                    }
+                )
+        return {key: dict(value) for key, value in summary.items()}
+
+    def get_total(self, name: str, **labels) -> float:
+        """
+        Return the sum of a counter over every set of labels
+        that includes the given labels.
+        """
+        labels = set(get_labels(labels))
+        with self.lock:
+            return sum(
+                value
+                for (key, key_labels), value in self.counters.items()
+                if key == name and labels <= set(key_labels)
+            )
+
+    def write(self, path: str) -> None:
+        """
+        Write the metrics to a file, in the Prometheus text format
+        when the path ends with '.prom' and as JSON otherwise.
+        """
+        if path.endswith(".prom"):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_json(), indent=2)
+        with open(path, "w") as f:
+            f.write(content)
+        return
+
+
+def get_labels(labels: dict) -> tuple:
+    """
+    Return the labels of a metric as sorted (key, string value) pairs.
+    """
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def format_value(value: float) -> str:
+    """
+    Return a sample value, whole numbers without a fraction.
+    """
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def format_labels(labels: tuple) -> str:
+    """
+    Return the labels of a metric as '{key="value",...}'.
+    """
+    if not labels:
+        return ""
+    pairs = list()
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class SpotifyLogFormatter(logging.Formatter):
+    """
+    Format log records as single line JSON objects.
+
+    The fields passed to a log call with 'extra' are added to the
+    object, so the logs can be filtered and aggregated by field.
+    """
+
+    # Attributes every log record has, the rest are extra fields.
+    reserved = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (key, value) for key, value in vars(record).items() if key not in self.reserved
+        )
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(level: str = None, fmt: str = None) -> None:
+    """
+    Configure the root logger of a script.
+
+    level   = Set the lowest level logged, e.g. DEBUG logs every
+            requested URL. Default: env SPOTIFY_LOG_LEVEL or INFO.
+
+    fmt = Set 'json' to log structured single line JSON objects or
+        'text' for plain lines. Default: env SPOTIFY_LOG_FORMAT or text.
+    """
+    level = level or os.environ.get("SPOTIFY_LOG_LEVEL", "INFO")
+    fmt = fmt or os.environ.get("SPOTIFY_LOG_FORMAT", "text")
+    handler = logging.StreamHandler()
+    if fmt == "json":
+        handler.setFormatter(SpotifyLogFormatter())
+    else:
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s")
+        )
+    logging.basicConfig(level=level.upper(), handlers=[handler], force=True)
+    # Every request would be logged by the HTTP libraries at DEBUG.
+    logging.getLogger("urllib3").setLevel(logging.WARNING)
+    return
@@ -0,0 +1,525 @@
+import argparse
+import base64
+import collections
+import datetime
+import hashlib
+import json
+import random
+import re
+import secrets
+import string
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class SpotifyMock:
+    """
+    Offline simulator of the Spotify Web API endpoints used by the client.
+
+    Generates synthetic, but realistically shaped and sized, responses
+    for the token, featured playlists, playlist, playlist tracks, tracks
+    and audio features endpoints. The same arguments always generate the
+    same data, featured playlists change a few times a day and a share
+    of the playlists change their tracks every day.
+
+    Run the simulator and point the app at it, nothing else changes:
+    python3 spotifymock.py --port 8000 --latency 0.05 --error-rate 0.01
+    SPOTIFY_API_URL=http://localhost:8000/v1
+    SPOTIFY_TOKEN_URL=http://localhost:8000/api/token
+
+    playlists   = Set the number of playlists to feature from.
+    catalog     = Set the number of tracks in the catalog.
+    featured    = Set the number of playlists featured per country.
+    changes     = Set the number of times a day the featured playlists
+                change.
+    tracks      = Set the (min, max) number of tracks of a playlist.
+    churn       = Set the share of playlists that change every day.
+    markets     = Set the number of 'available_markets' of tracks and
+                albums, the main driver of the payload size.
+    latency     = Set the seconds each response is delayed, plus up
+                to 'jitter' seconds at random.
+    error_rate  = Set the share of requests answered with a 429.
+    retry_after = Set the 'Retry-After' seconds of a 429 response.
+    rate_limit  = Set the number of requests an app can make in a
+                rolling 30 second window, 0 for no limit.
+    token_expiry    = Set the seconds an access token is valid.
+    seed    = Set the seed of the generated data.
+    """
+
+    def __init__(
+        self,
+        playlists: int = 2000,
+        catalog: int = 200000,
+        featured: int = 12,
+        changes: int = 4,
+        tracks: tuple = (20, 250),
+        churn: float = 0.1,
+        markets: int = 180,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        retry_after: int = 5,
+        rate_limit: int = 0,
+        token_expiry: int = 3600,
+        seed: int = 0,
+    ) -> None:
+        self.playlists = playlists
+        self.catalog = catalog
+        self.featured = featured
+        self.changes = changes
+        self.tracks = tracks
+        self.churn = churn
+        self.markets = [a + b for a in string.ascii_uppercase for b in string.ascii_uppercase][:markets]
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.rate_limit = rate_limit
+        self.token_expiry = token_expiry
+        self.seed = seed
+
+        self.ids = dict()  # Entity (kind, index) by generated Spotify ID.
+        self.tokens = dict()  # Client ID and expiry time by access token.
+        self.windows = collections.defaultdict(collections.deque)
+        self.stats = collections.Counter()  # Requests by endpoint and status.
+        self.lock = threading.Lock()
+        return
+
+    # Generated data.
+    def rng(self, *key) -> random.Random:
+        """
+        Return a random generator seeded by the key.
+        """
+        digest = hashlib.sha256(repr((self.seed, key)).encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def get_id(self, kind: str, index: int) -> str:
+        """
+        Return the 22 character base62 Spotify ID of an entity.
+        """
+        rng = self.rng("id", kind, index)
+        spotify_id = "".join(rng.choices(string.ascii_letters + string.digits, k=22))
+        self.ids[spotify_id] = (kind, index)
+        return spotify_id
+
+    def get_index(self, kind: str, spotify_id: str) -> int:
+        """
+        Return the index of a generated Spotify ID, or None.
+        """
+        entity = self.ids.get(spotify_id)
+        return entity[1] if entity and entity[0] == kind else None
+
+    def get_version(self, index: int) -> int:
+        """
+        Return the version of a playlist's tracks, churned
+        playlists get a new version every day.
+        """
+        if self.rng("churn", index).random() < self.churn:
+            return datetime.date.today().toordinal()
+        return 0
+
+    def get_track_indexes(self, index: int) -> list:
+        """
+        Return the catalog indexes of a playlist's tracks.
+
+        Popular tracks (low indexes) appear on many playlists.
+        """
+        rng = self.rng("playlist tracks", index, self.get_version(index))
+        count = rng.randint(*self.tracks)
+        return [int(self.catalog * rng.random() ** 2) for _ in range(count)]
+
+    def get_featured(self, country: str, timestamp: str) -> list:
+        """
+        Return the indexes of the playlists featured at the timestamp.
+
+        Half of the playlists are global, featured in every country.
+        """
+        moment = datetime.datetime.fromisoformat(timestamp)
+        block = moment.hour * self.changes // 24
+        rng = self.rng("featured", country, moment.date().isoformat(), block)
+        globals_ = rng.sample(range(self.playlists // 10), self.featured // 2)
+        locals_ = rng.sample(range(self.playlists), self.featured - len(globals_))
+        return list(dict.fromkeys(globals_ + locals_))
+
+    def artist(self, index: int) -> dict:
+        artist_id = self.get_id("artist", index)
+        return {
+            "external_urls": {"spotify": f"https://open.spotify.com/artist/{artist_id}"},
+            "href": f"https://api.spotify.com/v1/artists/{artist_id}",
+            "id": artist_id,
+            "name": f"Artist {index}",
+            "type": "artist",
+            "uri": f"spotify:artist:{artist_id}",
+        }
+
+    def image(self, key: str, size: int) -> dict:
+        digest = hashlib.sha1(f"{key}{size}".encode("utf-8")).hexdigest()
+        return {"height": size, "url": f"https://i.scdn.co/image/{digest}", "width": size}
+
+    def album(self, index: int) -> dict:
+        rng = self.rng("album", index)
+        album_id = self.get_id("album", index)
+        precision = rng.choice(["day", "day", "day", "month", "year"])
+        release = datetime.date(1960, 1, 1) + datetime.timedelta(rng.randint(0, 23000))
+        release_date = {
+            "day": release.isoformat(),
+            "month": release.isoformat()[:7],
+            "year": release.isoformat()[:4],
+        }[precision]
+        return {
+            "album_type": rng.choice(["album", "single", "compilation"]),
+            "artists": [self.artist(index % (self.catalog // 4 or 1))],
+            "available_markets": self.markets,
+            "external_urls": {"spotify": f"https://open.spotify.com/album/{album_id}"},
+            "href": f"https://api.spotify.com/v1/albums/{album_id}",
+            "id": album_id,
+            "images": [self.image(album_id, s) for s in (640, 300, 64)],
+            "name": f"Album {index}",
+            "release_date": release_date,
+            "release_date_precision": precision,
+            "total_tracks": rng.randint(1, 20),
+            "type": "album",
+            "uri": f"spotify:album:{album_id}",
+        }
+
+    def track(self, index: int) -> dict:
+        rng = self.rng("track", index)
+        track_id = self.get_id("track", index)
+        return {
+            "album": self.album(index // 8),
+            "artists": [self.artist(index // 8 % (self.catalog // 4 or 1))],
+            "available_markets": self.markets,
+            "disc_number": 1,
+            "duration_ms": rng.randint(60000, 420000),
+            "explicit": rng.random() < 0.2,
+            "external_ids": {"isrc": f"US{rng.randint(10**9, 10**10 - 1)}"},
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+            "href": f"https://api.spotify.com/v1/tracks/{track_id}",
+            "id": track_id,
+            "is_local": False,
+            "name": f"Track {index}",
+            "popularity": max(0, min(100, int(100 - 100 * index / self.catalog + rng.gauss(0, 5)))),
+            "preview_url": f"https://p.scdn.co/mp3-preview/{hashlib.sha1(track_id.encode()).hexdigest()}",
+            "track_number": rng.randint(1, 20),
+            "type": "track",
+            "uri": f"spotify:track:{track_id}",
+        }
+
+    def audio_features(self, index: int) -> dict:
+        rng = self.rng("audio features", index)
+        track_id = self.get_id("track", index)
+        return {
+            "acousticness": round(rng.random(), 4),
+            "analysis_url": f"https://api.spotify.com/v1/audio-analysis/{track_id}",
+            "danceability": round(rng.random(), 3),
+            "duration_ms": self.track(index)["duration_ms"],
+            "energy": round(rng.random(), 3),
+            "id": track_id,
+            "instrumentalness": round(rng.random() ** 4, 6),
+            "key": rng.randint(-1, 11),
+            "liveness": round(rng.random() / 2, 4),
+            "loudness": round(-rng.random() * 30, 3),
+            "mode": rng.randint(0, 1),
+            "speechiness": round(rng.random() / 3, 4),
+            "tempo": round(rng.uniform(60, 200), 3),
+            "time_signature": rng.choice([3, 4, 4, 4, 5]),
+            "track_href": f"https://api.spotify.com/v1/tracks/{track_id}",
+            "type": "audio_features",
+            "uri": f"spotify:track:{track_id}",
+            "valence": round(rng.random(), 4),
+        }
+
+    def playlist_item(self, track_index: int) -> dict:
+        return {
+            "added_at": "2023-05-01T00:00:00Z",
+            "added_by": {"id": "spotify", "type": "user"},
+            "is_local": False,
+            "track": self.track(track_index),
+        }
+
+    def playlist(self, index: int, simplified: bool = False) -> dict:
+        rng = self.rng("playlist", index)
+        playlist_id = self.get_id("playlist", index)
+        track_indexes = self.get_track_indexes(index)
+        version = self.get_version(index)
+        snapshot = hashlib.sha256(f"{playlist_id}{version}".encode()).hexdigest()
+        href = f"https://api.spotify.com/v1/playlists/{playlist_id}"
+        playlist = {
+            "collaborative": False,
+            "description": f"The playlist number {index}, updated regularly.",
+            "external_urls": {"spotify": f"https://open.spotify.com/playlist/{playlist_id}"},
+            "href": href,
+            "id": playlist_id,
+            "images": [self.image(playlist_id, 640)],
+            "name": f"Playlist {index}",
+            "owner": {"display_name": "Spotify", "id": "spotify", "type": "user"},
+            "primary_color": None,
+            "public": True,
+            "snapshot_id": snapshot[:32],
+            "tracks": {"href": f"{href}/tracks", "total": len(track_indexes)},
+            "type": "playlist",
+            "uri": f"spotify:playlist:{playlist_id}",
+        }
+        if not simplified:
+            followers = int(10 ** rng.uniform(2, 7) * (1 + 0.01 * version % 7))
+            playlist["followers"] = {"href": None, "total": followers}
+            playlist["tracks"] = self.playlist_tracks(index, 0, 100)
+        return playlist
+
+    def playlist_tracks(self, index: int, offset: int, limit: int) -> dict:
+        playlist_id = self.get_id("playlist", index)
+        track_indexes = self.get_track_indexes(index)
+        href = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
+        next_offset = offset + limit
+        return {
+            "href": f"{href}?offset={offset}&limit={limit}",
+            "items": [self.playlist_item(t) for t in track_indexes[offset:next_offset]],
+            "limit": limit,
+            "next": (
+                f"{href}?offset={next_offset}&limit={limit}"
+                if next_offset < len(track_indexes)
+                else None
+            ),
+            "offset": offset,
+            "previous": None,
+            "total": len(track_indexes),
+        }
+
+    def featured_playlists(self, country: str, timestamp: str, limit: int) -> dict:
+        items = [self.playlist(i, simplified=True) for i in self.get_featured(country, timestamp)]
+        return {
+            "message": "Featured",
+            "playlists": {
+                "href": "https://api.spotify.com/v1/browse/featured-playlists",
+                "items": items[:limit],
+                "limit": limit,
+                "next": None,
+                "offset": 0,
+                "previous": None,
+                "total": len(items),
+            },
+        }
+
+    def several(self, kind: str, ids: str, method) -> dict:
+        """
+        Return a response of several entities, unknown IDs are null.
+        """
+        items = list()
+        for spotify_id in ids.split(","):
+            index = self.get_index("track", spotify_id)
+            items.append(None if index is None else method(index))
+        return {kind: items}
+
+    # Request handling.
+    def respond(self, method: str, path: str, query: dict, headers: dict) -> tuple:
+        """
+        Return the status, headers and JSON body of a request.
+        """
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+        if method == "POST" and path == "/api/token":
+            return self.respond_token(headers)
+
+        client_id = self.authorize(headers)
+        if client_id is None:
+            return 401, {}, {"error": {"status": 401, "message": "The access token expired"}}
+        if self.is_rate_limited(client_id) or random.random() < self.error_rate:
+            retry = {"Retry-After": str(self.retry_after)}
+            return 429, retry, {"error": {"status": 429, "message": "API rate limit exceeded"}}
+
+        body = self.route(path, query)
+        if body is None:
+            return 404, {}, {"error": {"status": 404, "message": "Resource not found"}}
+        if "fields" in query:
+            body = select_fields(body, parse_fields(query["fields"]))
+
+        etag = '"' + hashlib.md5(json.dumps(body, sort_keys=True).encode()).hexdigest() + '"'
+        if headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, None
+        return 200, {"ETag": etag, "Cache-Control": "private, max-age=0"}, body
+
+    def route(self, path: str, query: dict) -> dict:
+        """
+        Return the body of a GET endpoint, or None.
+        """
+        if path == "/v1/browse/featured-playlists":
+            limit = int(query.get("limit", 20))
+            return self.featured_playlists(query["country"], query["timestamp"], limit)
+        match = re.fullmatch(r"/v1/playlists/(\w+)(/tracks)?", path)
+        if match:
+            index = self.get_index("playlist", match.group(1))
+            if index is None:
+                return None
+            if match.group(2):
+                offset = int(query.get("offset", 0))
+                limit = min(int(query.get("limit", 100)), 100)
+                return self.playlist_tracks(index, offset, limit)
+            return self.playlist(index)
+        if path == "/v1/tracks":
+            return self.several("tracks", query["ids"], self.track)
+        if path == "/v1/audio-features":
+            return self.several("audio_features", query["ids"], self.audio_features)
+        return None
+
+    def respond_token(self, headers: dict) -> tuple:
+        """
+        Issue an access token for the client credentials.
+        """
+        try:
+            credentials = base64.b64decode(headers["Authorization"].split()[1])
+            client_id = credentials.decode("utf-8").split(":")[0]
+        except (KeyError, IndexError, ValueError):
+            return 400, {}, {"error": "invalid_client"}
+        access_token = secrets.token_urlsafe(32)
+        with self.lock:
+            self.tokens[access_token] = (client_id, time.time() + self.token_expiry)
+        body = {
+            "access_token": access_token,
+            "token_type": "Bearer",
+            "expires_in": self.token_expiry,
+        }
+        return 200, {}, body
+
+    def authorize(self, headers: dict) -> str:
+        """
+        Return the client ID of a valid bearer token, or None.
+        """
+        authorization = headers.get("Authorization", "")
+        client_id, expires_at = self.tokens.get(authorization[7:], (None, 0))
+        return client_id if expires_at > time.time() else None
+
+    def is_rate_limited(self, client_id: str) -> bool:
+        """
+        Count the request in the app's rolling 30 second window.
+        """
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows[client_id]
+            while window and window[0] < now - 30:
+                window.popleft()
+            if len(window) >= self.rate_limit:
+                return True
+            window.append(now)
+        return False
+
+    def serve(self, host: str = "localhost", port: int = 8000) -> ThreadingHTTPServer:
+        """
+        Start the simulator in a background thread and return the server.
+        """
+        server = ThreadingHTTPServer((host, port), self.get_handler())
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
+
+    def get_handler(self) -> type:
+        """
+        Return a request handler class bound to the simulator.
+        """
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep connections alive.
+
+            def do_GET(self) -> None:
+                self.handle_request("GET")
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                self.rfile.read(length)
+                self.handle_request("POST")
+
+            def handle_request(self, method: str) -> None:
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                status, headers, body = mock.respond(
+                    method, url.path, query, dict(self.headers)
+                )
+                data = b"" if body is None else json.dumps(body).encode("utf-8")
+                endpoint = (url.path.split("/") + [""] * 3)[2]
+                with mock.lock:
+                    mock.stats[f"{endpoint} {status}"] += 1
+                    mock.stats["bytes"] += len(data)
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args) -> None:
+                return  # Requests are counted in 'stats' instead.
+
+        return Handler
+
+
+def parse_fields(fields: str) -> dict:
+    """
+    Parse a Spotify 'fields' filter into a tree of field names.
+
+    'id,followers.total,items(track(id))' becomes
+    {'id': {}, 'followers': {'total': {}}, 'items': {'track': {'id': {}}}}
+    """
+    tree = dict()
+    levels = [tree]  # Field trees opened by parentheses.
+    node = tree  # Field tree of the current dot separated path.
+    for name, separator in re.findall(r"([^,.()]*)([,.()]|$)", fields):
+        if name:
+            node = node.setdefault(name, dict())
+        if separator == "(":
+            levels.append(node)
+        elif separator == ")":
+            levels.pop()
+        if separator != ".":
+            node = levels[-1]
+    return tree
+
+
+def select_fields(body, tree: dict):
+    """
+    Keep only the fields of the tree, lists are filtered item by item.
+    """
+    if not tree or body is None:
+        return body
+    if isinstance(body, list):
+        return [select_fields(item, tree) for item in body]
+    return {key: select_fields(body[key], sub) for key, sub in tree.items() if key in body}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline Spotify Web API simulator.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--playlists", type=int, default=2000)
+    parser.add_argument("--catalog", type=int, default=200000)
+    parser.add_argument("--featured", type=int, default=12)
+    parser.add_argument("--changes", type=int, default=4)
+    parser.add_argument("--tracks", type=int, nargs=2, default=(20, 250))
+    parser.add_argument("--churn", type=float, default=0.1)
+    parser.add_argument("--markets", type=int, default=180)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=5)
+    parser.add_argument("--rate-limit", type=int, default=0)
+    parser.add_argument("--token-expiry", type=int, default=3600)
+    parser.add_argument("--seed", type=int, default=0)
+    args = vars(parser.parse_args())
+    host, port = args.pop("host"), args.pop("port")
+
+    mock = SpotifyMock(**args)
+    server = mock.serve(host, port)
+    print(f"Spotify Web API simulator listening on http://{host}:{port}")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"Requests served: {dict(mock.stats)}")
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,253 @@
+import abc
+import contextlib
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from google.cloud import storage
+
+logger = logging.getLogger(__name__)
+
+class SpotifySink(abc.ABC):
+    """
+    Storage the extracted files and the manifest are written to.
+
+    A sink names the files of a country and date, writes them as a
+    whole or not at all and returns their attributes for the manifest.
+    Small objects, e.g. the manifest, are read with a generation and
+    written on the condition that the generation still matches, a
+    write that lost a race raises PreconditionFailed.
+
+    See SpotifyGCSSink and SpotifyLocalSink.
+    """
+
+    @abc.abstractmethod
+    def get_name(self, country: str, date: str, region: str, table: str = None) -> str:
+        """
+        Return the name of the file of a country and date(YYYYMMDD).
+        """
+
+    @abc.abstractmethod
+    def get_manifest_name(self, date: str) -> str:
+        """
+        Return the name of the manifest of a date(YYYYMMDD).
+        """
+
+    @abc.abstractmethod
+    def get_uri(self, name: str) -> str:
+        """
+        Return the URI of a file, to be read by other tools.
+        """
+
+    @abc.abstractmethod
+    def open(self, name: str):
+        """
+        Return a context manager of a writable binary stream, the
+        file is written once the stream closes without an error.
+        """
+
+    @abc.abstractmethod
+    def stat(self, name: str) -> dict:
+        """
+        Return the name, size, checksums and generation of a file.
+        """
+
+    @abc.abstractmethod
+    def read(self, name: str) -> tuple:
+        """
+        Return the content of an object and its generation,
+        None and zero when the object does not exist.
+        """
+
+    @abc.abstractmethod
+    def write(self, name: str, data: bytes, generation: int, content_type: str = None) -> None:
+        """
+        Write an object if its generation matches, zero when
+        the object should not exist yet.
+        """
+
+
+class SpotifyGCSSink(SpotifySink):
+    """
+    Sink of a GCS bucket.
+
+    The files of a date are stored in a folder 'featured/YYYYMMDD',
+    named by country 'ISO-YYYYMMDD.parquet', the files of a table
+    of the normalized or nested output in a sub folder of the table.
+    The manifest of a date is 'featured/YYYYMMDD/manifest.json'.
+
+    A file is streamed into a resumable upload as it is written and
+    sent in 16 MiB chunks, the object is created once it is complete.
+    The upload is cancelled when writing the file fails, the writer of
+    the pinned google-cloud-storage release would otherwise finalize
+    the upload of a partly written file when it is closed.
+
+    client  = Set the GC Storage client, use a client per thread.
+
+    bucket_name = Set the ID of the GCS bucket.
+    """
+
+    def __init__(self, client: storage.Client, bucket_name: str) -> None:
+        self.bucket = client.bucket(bucket_name)
+        return
+
+    def get_name(self, country: str, date: str, region: str, table: str = None) -> str:
+        folder = f"featured/{date}/{table}" if table else f"featured/{date}"
+        return f"{folder}/{country}-{date}.parquet"
+
+    def get_manifest_name(self, date: str) -> str:
+        return f"featured/{date}/manifest.json"
+
+    def get_uri(self, name: str) -> str:
+        return f"gs://{self.bucket.name}/{name}"
+
+    @contextlib.contextmanager
+    def open(self, name: str):
+        blob = self.bucket.blob(name)
+        stream = blob.open("wb", chunk_size=16 * 1024 * 1024, ignore_flush=True)
+        try:
+            yield stream
+        except BaseException:
+            cancel_upload(stream)
+            raise
+        stream.close()  # Upload the last chunk, the object is created.
+
+    def stat(self, name: str) -> dict:
+        blob = self.bucket.blob(name)
+        blob.reload()  # Make an API request for the uploaded size and checksums.
+        return {
+            "name": name,
+            "size": blob.size,
+            "crc32c": blob.crc32c,
+            "md5": blob.md5_hash,
+            "generation": blob.generation,
+        }
+
+    def read(self, name: str) -> tuple:
+        blob = self.bucket.blob(name)  # A blob per read, safe in threads.
+        try:
+            data = blob.download_as_bytes()
+        except NotFound:
+            return None, 0
+        return data, blob.generation
+
+    def write(self, name: str, data: bytes, generation: int, content_type: str = None) -> None:
+        self.bucket.blob(name).upload_from_string(
+            data, content_type=content_type, if_generation_match=generation
+        )
+        return
+
+
+class SpotifyLocalSink(SpotifySink):
+    """
+    Sink of a local directory, a Hive partitioned dataset per table.
+
+    The files are stored by table, 'featured' for the denormalized
+    output, and partitioned by date, region and country:
+    'TABLE/featured_date=YYYYMMDD/region_code=EU/iso=SE/SE-YYYYMMDD.parquet'.
+    A table is queried directly as a dataset, e.g. with
+    pyarrow.dataset.dataset(path, partitioning="hive") or DuckDB's
+    read_parquet(path + '/**/*.parquet', hive_partitioning=true).
+
+    The keys are not named 'featured' and 'region', the files hold
+    columns of those names, the hourly timestamp and the name of the
+    continent, which would conflict with the partition values.
+
+    A file is written to a temporary file in its directory and renamed
+    once complete, a reader never sees a partly written file. The
+    manifest of a date is 'manifest/YYYYMMDD.json', written under a
+    file lock. The generation of an object is derived from its content.
+
+    path    = Set the root directory of the datasets.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.abspath(path)
+        return
+
+    def get_name(self, country: str, date: str, region: str, table: str = None) -> str:
+        partition = f"featured_date={date}/region_code={region}/iso={country}"
+        return f"{table or 'featured'}/{partition}/{country}-{date}.parquet"
+
+    def get_manifest_name(self, date: str) -> str:
+        return f"manifest/{date}.json"
+
+    def get_uri(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @contextlib.contextmanager
+    def open(self, name: str):
+        path = self.get_uri(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Hidden by its leading dot, dataset readers skip the file.
+        fd, temp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as stream:
+                yield stream
+                stream.flush()
+                os.fsync(stream.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def stat(self, name: str) -> dict:
+        result = os.stat(self.get_uri(name))
+        return {
+            "name": name,
+            "size": result.st_size,
+            "crc32c": None,
+            "md5": None,
+            "generation": result.st_mtime_ns,
+        }
+
+    def read(self, name: str) -> tuple:
+        try:
+            with open(self.get_uri(name), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None, 0
+        return data, get_generation(data)
+
+    def write(self, name: str, data: bytes, generation: int, content_type: str = None) -> None:
+        path = self.get_uri(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)  # Released when closed.
+            _, current = self.read(name)
+            if current != generation:
+                raise PreconditionFailed(f"Object {name} was written by another process.")
+            with self.open(name) as stream:
+                stream.write(data)
+        return
+
+
+def get_generation(data: bytes) -> int:
+    """
+    Return a generation of an object derived from its content, never zero.
+    """
+    return int.from_bytes(hashlib.sha256(data).digest()[:7], "big") or 1
+
+
+def cancel_upload(stream) -> None:
+    """
+    Cancel the resumable upload of a GCS blob writer, the object is
+    not created. Releases of google-cloud-storage without the writer's
+    'terminate' are cancelled the same way, by deleting the upload
+    session and closing the buffer without sending the last chunk.
+    """
+    try:
+        if hasattr(stream, "terminate"):
+            stream.terminate()
+        elif stream._upload_and_transport:
+            upload, transport = stream._upload_and_transport
+            transport.delete(upload.upload_url)
+    except Exception as error:
+        # An abandoned session expires, it never creates the object.
+        logger.warning("Could not cancel the upload of a file: %r", error)
+    finally:
+        stream._buffer.close()  # Closing the writer uploads nothing now.
+    return
@@ -0,0 +1,221 @@
+import json
+import logging
+import os
+import pandas as pd
+import sqlite3
+import sys
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class SpotifyStore:
+    """
+    Local store of the entities retrieved from the Spotify Web API.
+
+    Playlists, tracks and audio features are stored by their Spotify ID
+    within a scope, the date of the extraction. Every country of a region,
+    and every region process pointed at the same file, reuses an entity
+    fetched once for that date instead of requesting it again. Only the
+    fields the app builds its dataframes from are stored, not the full
+    responses, see 'SpotifyData.project_entity'.
+
+    Audio features of a track never change, they are stored without a
+    date and persist across DAG runs, only tracks never seen before are
+    requested. The cache can be seeded from previously written Parquet
+    files with 'seed_audio_features'. Playlist snapshots are persisted
+    the same way, replaced whenever a playlist changes.
+
+    The store is a SQLite database in WAL mode, which lets the region
+    processes read while another process writes to it.
+
+    path    = Set the path of the SQLite database file.
+            Default: env SPOTIFY_STORE_PATH or 'spotify-store.db'
+            in the temporary directory.
+    """
+
+    def __init__(self, path: str = None) -> None:
+        self.path = path or os.environ.get(
+            "SPOTIFY_STORE_PATH",
+            os.path.join(tempfile.gettempdir(), "spotify-store.db"),
+        )
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            self.path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entities (
+                scope TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                entity_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                PRIMARY KEY (scope, kind, entity_id)
+            ) WITHOUT ROWID
+            """
+        )
+        return
+
+    # Kinds of entities that are stored across dates.
+    persistent_kinds = ("audio_features", "playlist_snapshots")
+
+    def get_scope(self, kind: str, scope: str) -> str:
+        """
+        Return the scope an entity of a kind is stored in.
+        """
+        return "*" if kind in self.persistent_kinds else scope
+
+    def get_entities(self, kind: str, entity_ids: list, scope: str) -> dict:
+        """
+        Return the stored entities of a kind, by Spotify ID.
+
+        IDs that have not been stored in the scope are left out.
+        """
+        scope = self.get_scope(kind, scope)
+        entities = dict()
+        with self.lock:
+            # Stay below SQLite's limit of host parameters per query.
+            for i in range(0, len(entity_ids), 500):
+                chunk = list(entity_ids[i : i + 500])
+                rows = self.connection.execute(
+                    f"""
+                    SELECT entity_id, payload FROM entities
+                    WHERE scope = ? AND kind = ?
+                    AND entity_id IN ({",".join("?" * len(chunk))})
+                    """,
+                    [scope, kind, *chunk],
+                )
+                entities.update((key, json.loads(value)) for key, value in rows)
+        return entities
+
+    def put_entities(
+        self, kind: str, entities: dict, scope: str, replace: bool = False
+    ) -> None:
+        """
+        Store entities of a kind, by Spotify ID.
+
+        An entity already stored in the scope, by another country
+        or region process, is kept as it is unless 'replace' is set.
+        """
+        scope = self.get_scope(kind, scope)
+        rows = [
+            (scope, kind, key, json.dumps(value)) for key, value in entities.items()
+        ]
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.executemany(
+                    f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO entities"
+                    " VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.rollback()
+                raise
+        return
+
+    def claim_entities(
+        self, kind: str, entity_ids: list, scope: str, claimant: str
+    ) -> set:
+        """
+        Claim entities of a kind for a claimant, e.g. the country that
+        writes them, and return the IDs the claimant holds.
+
+        The claims are made in a single transaction, an entity is held
+        by the first claimant only, whatever other country or region
+        process claims it at the same time. A claimant that claims
+        again, e.g. a retried country, holds its earlier claims.
+        """
+        scope = self.get_scope(kind, scope)
+        claim = json.dumps(claimant)
+        claimed = set()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO entities VALUES (?, ?, ?, ?)",
+                    [(scope, kind, key, claim) for key in entity_ids],
+                )
+                for i in range(0, len(entity_ids), 500):
+                    chunk = list(entity_ids[i : i + 500])
+                    rows = self.connection.execute(
+                        f"""
+                        SELECT entity_id FROM entities
+                        WHERE scope = ? AND kind = ? AND payload = ?
+                        AND entity_id IN ({",".join("?" * len(chunk))})
+                        """,
+                        [scope, kind, claim, *chunk],
+                    )
+                    claimed.update(key for key, in rows)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.rollback()
+                raise
+        return claimed
+
+    def rollback(self) -> None:
+        """
+        Roll back the open transaction of a failed write, if any, so
+        the shared connection can begin the next one.
+        """
+        if self.connection.in_transaction:
+            self.connection.execute("ROLLBACK")
+        return
+
+    def prune(self, before: str) -> None:
+        """
+        Delete the entities stored in scopes older than 'before',
+        persistent entities are kept.
+        """
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM entities WHERE scope < ? AND scope != '*'", [before]
+            )
+        return
+
+    def seed_audio_features(self, df: pd.DataFrame) -> None:
+        """
+        Store the audio features of previously extracted data.
+
+        The dataframe columns are mapped back to the audio features
+        endpoint fields. Values stored as Parquet datatypes convert
+        to the same values when extracted again.
+        """
+        fields = {
+            "track_id": "id",
+            "track_audio_danceability": "danceability",
+            "track_audio_energy": "energy",
+            "track_audio_tonality": "key",
+            "track_audio_loudness": "loudness",
+            "track_audio_mode": "mode",
+            "track_audio_speechiness": "speechiness",
+            "track_audio_acousticness": "acousticness",
+            "track_audio_instrumentalness": "instrumentalness",
+            "track_audio_liveness": "liveness",
+            "track_audio_valence": "valence",
+            "track_audio_tempo": "tempo",
+            "track_audio_time_signature": "time_signature",
+        }
+        df = (
+            df[list(fields)]
+            .drop_duplicates("track_id")
+            .rename(columns=fields)
+            .astype(object)
+        )
+        audio_features = {a["id"]: a for a in df.to_dict("records")}
+        self.put_entities("audio_features", audio_features, "*")
+        logger.info("Seeded %s audio features into %s", len(audio_features), self.path)
+        return
+
+
+if __name__ == "__main__":
+    # Seed the audio features cache from Parquet files.
+    # python3 spotifystore.py path/to/ISO-YYYYMMDD.parquet ...
+    logging.basicConfig(level=logging.INFO)
+    store = SpotifyStore()
+    for path in sys.argv[1:]:
+        store.seed_audio_features(pd.read_parquet(path))
@@ -0,0 +1,191 @@
+import base64
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import requests
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SpotifyToken:
+    """
+    Access token of a Spotify app, refreshed before it expires.
+
+    The token is refreshed in a background thread well before it
+    expires ('2 * margin' seconds), requests only refresh it themselves
+    when less than 'margin' seconds are left or after a 401 response.
+
+    The token is cached in a file shared by every process that uses
+    the same app. The file is locked while refreshing, so processes
+    reuse a token another process has requested instead of each
+    requesting their own.
+
+    margin  = Set the number of seconds before expiry the token
+            is considered expired.
+
+    path    = Set the token cache file.
+            Default: 'spotify-token-{hash of client ID}.json' in
+            env SPOTIFY_TOKEN_CACHE or the temporary directory.
+
+    Tokens are requested from env SPOTIFY_TOKEN_URL when set, to run
+    against the offline simulator in 'spotifymock.py'.
+    """
+
+    def __init__(
+        self, client_id: str, client_secret: str, margin: int = 300, path: str = None
+    ) -> None:
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.margin = margin
+        self.tkn_url = os.environ.get(
+            "SPOTIFY_TOKEN_URL", "https://accounts.spotify.com/api/token"
+        )
+        key = f"{client_id}@{self.tkn_url}"  # Keep tokens of the simulator apart.
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+        self.path = path or os.path.join(
+            os.environ.get("SPOTIFY_TOKEN_CACHE", tempfile.gettempdir()),
+            f"spotify-token-{digest}.json",
+        )
+        self.access_token = None
+        self.expires_at = 0.0
+        self.lock = threading.Lock()
+        self.timer = None
+        self.session = requests.Session()
+        return
+
+    def get(self) -> str:
+        """
+        Return a valid access token.
+        """
+        if self.expires_at - time.time() < self.margin:
+            return self.refresh(self.access_token)
+        return self.access_token
+
+    def refresh(self, expired: str = None) -> str:
+        """
+        Replace the 'expired' access token and return the new one.
+
+        A token already replaced by another thread, or by another
+        process through the cache file, is reused as it is.
+        """
+        with self.lock:
+            if self.is_valid(self.access_token, self.expires_at, expired):
+                return self.access_token
+
+            with open(self.path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)  # Released on close.
+                token = self.read_cache()
+                cached = token.get("access_token"), token.get("expires_at", 0)
+                if not self.is_valid(*cached, expired):
+                    token = self.request_token()
+                    self.write_cache(token)
+
+            self.access_token = token["access_token"]
+            self.expires_at = token["expires_at"]
+            self.schedule()
+        return self.access_token
+
+    def is_valid(self, access_token: str, expires_at: float, expired: str) -> bool:
+        """
+        Return True if the token is not the expired one
+        and has more than 'margin' seconds left.
+        """
+        return (
+            access_token is not None
+            and access_token != expired
+            and expires_at - time.time() >= self.margin
+        )
+
+    def schedule(self) -> None:
+        """
+        Schedule the background refresh of the current token.
+        """
+        if self.timer:
+            self.timer.cancel()
+        delay = max(0.0, self.expires_at - 2 * self.margin - time.time())
+        self.timer = threading.Timer(delay, self.refresh_in_background)
+        self.timer.daemon = True
+        self.timer.start()
+        return
+
+    def refresh_in_background(self) -> None:
+        """
+        Refresh the current token, failures are left to the requests.
+        """
+        try:
+            self.refresh(self.access_token)
+        except Exception as error:
+            logger.warning("Background token refresh failed: %r", error)
+        return
+
+    def read_cache(self) -> dict:
+        """
+        Return the cached token, or an empty dictionary.
+        """
+        try:
+            with open(self.path) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return dict()
+
+    def write_cache(self, token: dict) -> None:
+        """
+        Atomically replace the cached token, readable by the owner only.
+        """
+        directory = os.path.dirname(self.path)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".spotify-token-")
+        with os.fdopen(fd, "w") as temp_file:
+            json.dump(token, temp_file)
+        os.replace(temp_path, self.path)
+        return
+
+    def request_token(self, retry: int = 3) -> dict:
+        """
+        Send a POST request to the /api/token endpoint.
+
+        Return the access token and the time it expires at.
+        """
+        # Encode (base64) string that contains
+        # client ID and client secret key.
+        auth_string = f"{self.client_id}:{self.client_secret}"
+        auth_bytes = auth_string.encode("utf-8")
+        auth_base64 = str(base64.b64encode(auth_bytes), "utf-8")
+
+        # Header and body config for token API request.
+        header = {
+            "Authorization": "Basic " + auth_base64,
+            "Content-Type": "application/x-www-form-urlencoded",
+        }
+        body = {"grant_type": "client_credentials"}
+
+        while retry > 0:
+            try:
+                # Make an API request
+                response = self.session.post(self.tkn_url, headers=header, data=body)
+                response.raise_for_status()
+            except requests.exceptions.ConnectionError as connection_error:
+                logger.warning(
+                    "Connection error occured while requesting for access token: %r",
+                    connection_error,
+                )
+            else:
+                logger.info("Finished requesting for access token.")
+                response_json = response.json()
+                return {
+                    "access_token": response_json["access_token"],
+                    "expires_at": time.time() + response_json["expires_in"],
+                }
+            retry -= 1
+
+            # When requesting for a new access token the
+            # connection to the server will need to refresh/update
+            # 30 seconds between the calls should suffice.
+            logger.info("Sleeping for 30 seconds before retrying the token request.")
+            time.sleep(30)
+        else:
+            raise RuntimeError("Max retries exceeded while requesting token, aborting.")
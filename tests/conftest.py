@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The scripts are run from their folder, import them the same way.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
@@ -0,0 +1,116 @@
+import json
+
+import pytest
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+import bigqueryload
+
+
+class FakeBlob:
+    def __init__(self, objects: dict, name: str) -> None:
+        self.objects = objects
+        self.name = name
+        self.generation = None
+
+    def download_as_bytes(self) -> bytes:
+        if self.name not in self.objects:
+            raise NotFound(self.name)
+        self.generation = 1
+        return self.objects[self.name]
+
+
+class FakeBucket:
+    def __init__(self, objects: dict, name: str) -> None:
+        self.objects = objects
+        self.name = name
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self.objects, name)
+
+
+class FakeStorageClient:
+    def __init__(self, objects: dict) -> None:
+        self.objects = objects
+
+    def bucket(self, name: str) -> FakeBucket:
+        return FakeBucket(self.objects, name)
+
+
+class FakeJob:
+    def __init__(self) -> None:
+        self.done = False
+
+    def result(self) -> None:
+        self.done = True
+
+
+class FakeBigQueryClient:
+    def __init__(self) -> None:
+        self.loads = list()
+
+    def load_table_from_uri(self, source_uris, destination, job_config=None) -> FakeJob:
+        job = FakeJob()
+        self.loads.append((source_uris, destination, job_config, job))
+        return job
+
+
+def get_manifest(countries: dict) -> dict:
+    """
+    Return a manifest of the countries, by ISO code, with a flat
+    and a nested file each.
+    """
+    return {
+        "date": "20230526",
+        "countries": {
+            iso: {
+                "region": region,
+                "normalized": False,
+                "rows": 100,
+                "files": [
+                    {"name": f"featured/20230526/{iso}-20230526.parquet", "table": None},
+                    {"name": f"featured/20230526/nested/{iso}-20230526.parquet", "table": "nested"},
+                ],
+            }
+            for iso, region in countries.items()
+        },
+    }
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    monkeypatch.setattr(bigqueryload, "bucket_name", "bucket", raising=False)
+    monkeypatch.setattr(bigqueryload, "destination_table", "project.dataset.featured", raising=False)
+
+
+def test_load_to_partition(tables):
+    manifest = get_manifest({"SE": "EU", "DE": "EU"})
+    objects = {"featured/20230526/manifest.json": json.dumps(manifest).encode()}
+    client = FakeBigQueryClient()
+
+    bigqueryload.load_to_partition("2023-05-26", client, FakeStorageClient(objects))
+
+    (source_uris, destination, job_config, job), = client.loads
+    assert source_uris == [
+        "gs://bucket/featured/20230526/nested/DE-20230526.parquet",
+        "gs://bucket/featured/20230526/nested/SE-20230526.parquet",
+    ]
+    assert destination == "project.dataset.featured$20230526"
+    assert job_config.source_format == bigquery.SourceFormat.PARQUET
+    assert job_config.write_disposition == bigquery.WriteDisposition.WRITE_TRUNCATE
+    assert job_config.time_partitioning.field == "featured"
+    assert job_config.clustering_fields == ["region", "iso"]
+    assert job_config.parquet_options.enable_list_inference is True
+    assert job.done
+
+
+@pytest.mark.parametrize("manifest", [None, get_manifest({})])
+def test_load_to_partition_empty(tables, manifest):
+    objects = dict()
+    if manifest is not None:
+        objects["featured/20230526/manifest.json"] = json.dumps(manifest).encode()
+    client = FakeBigQueryClient()
+
+    with pytest.raises(RuntimeError):
+        bigqueryload.load_to_partition("2023-05-26", client, FakeStorageClient(objects))
+    assert not client.loads
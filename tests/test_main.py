@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+import spotifycredentials
+from spotifymanifest import SpotifyManifest
+from spotifymock import SpotifyMock
+from spotifysink import SpotifyLocalSink
+
+
+@pytest.fixture
+def simulator(monkeypatch, tmp_path):
+    """
+    Run the extraction against a small offline simulator.
+    """
+    mock = SpotifyMock(playlists=40, catalog=2000, featured=2, tracks=(5, 20), markets=1)
+    server = mock.serve("localhost", 0)
+    url = f"http://localhost:{server.server_address[1]}"
+    monkeypatch.setenv("SPOTIFY_API_URL", f"{url}/v1")
+    monkeypatch.setenv("SPOTIFY_TOKEN_URL", f"{url}/api/token")
+    monkeypatch.setenv("SPOTIFY_EU_ID", "client-id")
+    monkeypatch.setenv("SPOTIFY_EU_SECRET", "client-secret")
+    monkeypatch.setenv("SPOTIFY_TOKEN_CACHE", str(tmp_path))
+    monkeypatch.setenv("SPOTIFY_STORE_PATH", str(tmp_path / "store.db"))
+    monkeypatch.setenv("SPOTIFY_JOURNAL_PATH", str(tmp_path / "journal.db"))
+    monkeypatch.delenv("SPOTIFY_METRICS_PATH", raising=False)
+    # The simulator has no rate limit, do not pace the requests.
+    limiter = spotifycredentials.SpotifyLimiter
+    monkeypatch.setattr(
+        spotifycredentials,
+        "SpotifyLimiter",
+        lambda share: limiter(rate=1000, burst=1000, max_rate=1000),
+    )
+    yield mock
+    server.shutdown()
+
+
+def test_nested_run_after_flat_run(simulator, tmp_path):
+    date = (datetime.now() - timedelta(1)).strftime("%Y-%m-%d")
+    local = str(tmp_path / "data")
+    manifest = SpotifyManifest(SpotifyLocalSink(local), date)
+
+    main.main("EU", date, countries=["SE", "DE"], workers=2, local=local)
+    assert manifest.get_countries() == {"DE", "SE"}
+    assert manifest.get_countries("nested") == set()
+
+    # The flat files do not count as the nested output of the date.
+    main.main("EU", date, countries=["SE", "DE"], workers=2, local=local, nested=True)
+    assert manifest.get_countries("nested") == {"DE", "SE"}
+    assert len(manifest.get_uris("nested")) == 2
+    # The flat files stay recorded next to the nested files.
+    assert len(manifest.get_uris()) == 2
+
+    # Both outputs are loaded, a run of either requests nothing.
+    simulator.stats.clear()
+    main.main("EU", date, countries=["SE", "DE"], workers=2, local=local, nested=True)
+    main.main("EU", date, countries=["SE", "DE"], workers=2, local=local)
+    assert not simulator.stats
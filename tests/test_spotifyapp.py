@@ -0,0 +1,146 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from spotifyapp import SpotifyApp
+from spotifydata import SpotifyData
+
+T1 = pd.Timestamp("2023-05-26T10:00:00")
+T2 = pd.Timestamp("2023-05-26T11:00:00")
+
+
+@pytest.fixture
+def app():
+    app = SpotifyApp.__new__(SpotifyApp)  # No API client needed.
+    app.data = SpotifyData()
+    return app
+
+
+def get_track(track_id: str, n: int) -> dict:
+    """
+    Return the columns of a track, its artist, album and audio features.
+    """
+    return {
+        "track_id": track_id,
+        "track_name": f"Track {n}",
+        "track_popularity": 10 * n,
+        "track_duration": 180 + n,
+        "track_explicit": n % 2 == 0,
+        "track_artist_id": f"artist{n}",
+        "track_artist_name": f"Artist {n}",
+        "track_album_id": f"album{n}",
+        "track_album_name": f"Album {n}",
+        "track_album_type": "album",
+        "track_album_release": datetime.date(2020, 1, n),
+        **{
+            column: n / 4
+            for column in (
+                "track_audio_acousticness",
+                "track_audio_danceability",
+                "track_audio_energy",
+                "track_audio_instrumentalness",
+                "track_audio_liveness",
+                "track_audio_loudness",
+                "track_audio_speechiness",
+                "track_audio_valence",
+            )
+        },
+        **{
+            column: n
+            for column in (
+                "track_audio_mode",
+                "track_audio_tempo",
+                "track_audio_time_signature",
+                "track_audio_tonality",
+            )
+        },
+    }
+
+
+def get_merged(app: SpotifyApp) -> pd.DataFrame:
+    """
+    Return a merged frame, SE features two playlists at 10:00
+    and one at 11:00, DE features one playlist at 10:00.
+    """
+    playlists = {
+        "P1": ["T1", "T2"],
+        "P2": ["T3"],
+    }
+    featured = [
+        (T2, "SE", "Sweden", "P1"),
+        (T1, "SE", "Sweden", "P2"),
+        (T1, "DE", "Germany", "P2"),
+        (T1, "SE", "Sweden", "P1"),
+    ]
+    rows = [
+        {
+            "featured": timestamp,
+            "region": "Europe",
+            "iso": iso,
+            "country": country,
+            "playlist_id": playlist_id,
+            "playlist_name": f"Playlist {playlist_id}",
+            "playlist_followers_total": 100,
+            "playlist_tracks_total": len(playlists[playlist_id]),
+            **get_track(track_id, int(track_id[1:])),
+        }
+        for timestamp, iso, country, playlist_id in featured
+        for track_id in playlists[playlist_id]
+    ]
+    return app.convert_dtypes(pd.DataFrame(rows))
+
+
+def flatten(app: SpotifyApp, nested: list) -> pd.DataFrame:
+    """
+    Return the rows of the nested records, a row per track.
+    """
+    columns = app.get_nested_columns()
+    rows = list()
+    for row in nested:
+        for playlist in row["playlist"]:
+            for track in playlist["track"]:
+                flat = {c: row[c] for c in ("featured", "region", "iso", "country")}
+                flat.update({c: playlist[c] for c in columns["playlist"]})
+                flat.update({c: track[c] for c in columns["track"]})
+                for name in ("artist", "album", "audio"):
+                    flat.update(track[name])
+                rows.append(flat)
+    return pd.DataFrame(rows)
+
+
+def test_nest_data(app):
+    df = get_merged(app)
+
+    table = app.nest_data(df)
+
+    assert table.column_names == ["featured", "region", "iso", "country", "playlist"]
+    assert table.num_rows == 3  # (10:00, DE), (10:00, SE) and (11:00, SE).
+
+    flat = flatten(app, table.to_pylist())
+    flat["featured"] = flat["featured"].dt.tz_localize(None)
+    keys = ["featured", "iso", "playlist_id", "track_id"]
+    expected = df.sort_values(keys, ignore_index=True)
+    flat = app.convert_dtypes(flat[list(df.columns)]).sort_values(keys, ignore_index=True)
+    pd.testing.assert_frame_equal(flat, expected, check_dtype=False)
+
+
+def test_nest_data_offsets(app):
+    table = app.nest_data(get_merged(app))
+
+    playlists = table.column("playlist").combine_chunks()
+    # (10:00, DE) features P2, (10:00, SE) P1 and P2, (11:00, SE) P1.
+    assert playlists.offsets.to_pylist() == [0, 1, 3, 4]
+    assert playlists.flatten().field("playlist_id").to_pylist() == ["P2", "P1", "P2", "P1"]
+
+    tracks = playlists.flatten().field("track")
+    assert tracks.offsets.to_pylist() == [0, 1, 3, 4, 6]
+    assert tracks.flatten().field("track_id").to_pylist() == ["T3", "T1", "T2", "T3", "T1", "T2"]
+
+
+def test_nest_data_intervals(app):
+    df = get_merged(app)
+    intervals = df.drop(columns=["featured"]).assign(featured_from=T1, featured_to=T2)
+
+    with pytest.raises(ValueError):
+        app.nest_data(intervals)
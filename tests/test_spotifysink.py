@@ -0,0 +1,103 @@
+import gc
+import io
+import types
+
+import pytest
+from google.cloud.storage import fileio
+
+from spotifysink import SpotifyGCSSink
+
+MiB = 1024 * 1024
+
+
+class PinnedBlobWriter(fileio.BlobWriter):
+    """
+    The writer of the pinned google-cloud-storage release, without
+    'terminate', closed (and finalized) on an error as well.
+    """
+
+    terminate = property(doc="Missing from the pinned release.")
+    __exit__ = io.IOBase.__exit__
+
+
+class FakeUpload:
+    def __init__(self, blob, stream, chunk_size: int) -> None:
+        self.blob = blob
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.upload_url = f"https://upload/{blob.name}"
+
+    def transmit_next_chunk(self, transport) -> None:
+        data = self.stream.read(self.chunk_size)
+        self.blob.sent += len(data)
+        if len(data) < self.chunk_size:  # The last chunk creates the object.
+            self.blob.finalized = True
+
+
+class FakeTransport:
+    def __init__(self, blob) -> None:
+        self.blob = blob
+
+    def delete(self, url: str) -> None:
+        self.blob.deleted.append(url)
+
+
+class FakeBlob:
+    def __init__(self, name: str, writer) -> None:
+        self.name = name
+        self.writer = writer
+        self.bucket = types.SimpleNamespace(client=None)
+        self.sent = 0
+        self.finalized = False
+        self.deleted = list()
+
+    def open(self, mode: str, chunk_size: int = None, ignore_flush: bool = False):
+        return self.writer(self, chunk_size=chunk_size, ignore_flush=ignore_flush)
+
+    def _initiate_resumable_upload(self, client, stream, content_type, size, chunk_size=None, **kwargs):
+        return FakeUpload(self, stream, chunk_size), FakeTransport(self)
+
+
+class FakeStorageClient:
+    def __init__(self, writer) -> None:
+        self.writer = writer
+        self.blobs = dict()
+
+    def bucket(self, name: str):
+        return types.SimpleNamespace(name=name, blob=self.blob)
+
+    def blob(self, name: str) -> FakeBlob:
+        return self.blobs.setdefault(name, FakeBlob(name, self.writer))
+
+
+@pytest.mark.parametrize("writer", [fileio.BlobWriter, PinnedBlobWriter])
+def test_open(writer):
+    client = FakeStorageClient(writer)
+    sink = SpotifyGCSSink(client, "bucket")
+
+    with sink.open("SE.parquet") as stream:
+        stream.write(b"x" * 20 * MiB)
+
+    blob = client.blobs["SE.parquet"]
+    assert blob.finalized
+    assert blob.sent == 20 * MiB
+    assert not blob.deleted
+
+
+@pytest.mark.parametrize("writer", [fileio.BlobWriter, PinnedBlobWriter])
+@pytest.mark.parametrize("size", [1 * MiB, 20 * MiB])
+def test_open_failed_write(writer, size):
+    client = FakeStorageClient(writer)
+    sink = SpotifyGCSSink(client, "bucket")
+
+    with pytest.raises(ValueError):
+        with sink.open("SE.parquet") as stream:
+            stream.write(b"x" * size)
+            raise ValueError("Failed while writing the file.")
+    del stream
+    gc.collect()  # A collected writer is closed, it must not upload either.
+
+    blob = client.blobs["SE.parquet"]
+    assert not blob.finalized
+    # The upload session is started once a chunk is full, and deleted.
+    assert blob.deleted == (["https://upload/SE.parquet"] if size > 16 * MiB else [])